@@ -1,5 +1,12 @@
 class BaseAccessor:
-    """The base class responsible for linking logic to the base application."""
+    """The base class responsible for linking logic to the base application.
+
+    Attributes:
+        dependencies (tuple[str, ...]): The class names of the accessors that must be connected
+            before this one.
+    """
+
+    dependencies: tuple[str, ...] = ()
 
     def __init__(self, app):
         """Initialization of the connected service in the main Fast-Api application.
@@ -9,8 +16,7 @@ class BaseAccessor:
         """
         self.app = app
         self.logger = app.logger
-        app.on_event("startup")(self.connect)
-        app.on_event("shutdown")(self.disconnect)
+        app.lifecycle.register(self)
         self._init()
 
     def _init(self):
@@ -16,11 +16,13 @@ class BaseAccessor:
     Attributes:
         logger (logging.Logger): The logger for the accessor.
         app (core.components.Application): The application instance.
+        dependencies (tuple[str, ...]): The class names of the accessors that must be connected before this one.
 
     """
 
     logger: Optional[Logger]
     app: Optional[Application]
+    dependencies: tuple[str, ...]
 
     def __init__(self, app: Application):
         """
@@ -19,6 +19,9 @@ HTTP_EXCEPTION = {
     status.HTTP_403_FORBIDDEN: "403 Forbidden",
     status.HTTP_404_NOT_FOUND: "404 Not Found",
     status.HTTP_405_METHOD_NOT_ALLOWED: "405 Method Not Allowed",
+    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: "413 Request Entity Too Large",
+    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE: "415 Unsupported Media Type",
     status.HTTP_422_UNPROCESSABLE_ENTITY: "422 Unavailable Entity",
     status.HTTP_500_INTERNAL_SERVER_ERROR: "500 Internal server error",
+    status.HTTP_503_SERVICE_UNAVAILABLE: "503 Service Unavailable",
 }
@@ -0,0 +1,31 @@
+"""The launcher of the separate bot process.
+
+Used when `BOT_MODE` is "process": the web application started by `main.py` only accepts the files,
+and this process runs the Telegram bot, the reports and the uploads of the files.
+"""
+
+import asyncio
+import signal
+
+from core.app import setup_bot_app
+
+
+async def run():
+    """Runs the bot process until it is stopped by a signal or the bot is disconnected."""
+    app = setup_bot_app()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await app.lifecycle.startup()
+    try:
+        disconnected = asyncio.ensure_future(app.bot.bot.disconnected)
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait([disconnected, stopped], return_when=asyncio.FIRST_COMPLETED)
+        stopped.cancel()
+    finally:
+        await app.lifecycle.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
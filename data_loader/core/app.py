@@ -1,10 +1,11 @@
 """The location of the final assembly of the application."""
 
 from core.components import Application
+from core.lifecycle import setup_lifecycle
 from core.logger import setup_logging
 from core.middelware import setup_middleware
 from core.routes import setup_routes
-from core.settings import AppSettings
+from core.settings import AppSettings, get_settings
 from store.store import setup_store
 
 
@@ -14,7 +15,7 @@ def setup_app() -> "Application":
     Returns:
         Application: The main FastAPI application.
     """
-    settings = AppSettings()
+    settings = get_settings(AppSettings)
     app = Application(
         docs_url=settings.docs_url,
         redoc_url=settings.redoc_url,
@@ -25,8 +26,25 @@ def setup_app() -> "Application":
     )
     app.settings = settings
     setup_logging(app)
-    setup_store(app)
+    setup_lifecycle(app)
+    setup_store(app, bot=settings.bot_mode == "embedded")
     setup_middleware(app)
     setup_routes(app)
     app.logger.info(f"Swagger link: {app.settings.base_url}{app.docs_url}")
     return app
+
+
+def setup_bot_app() -> "Application":
+    """Creates the application of the separate bot process.
+
+    The bot process runs the Telegram bot, the reports and the uploads of the files,
+    and the web application only accepts the files, see `AppSettings.bot_mode`.
+
+    Returns:
+        Application: The application without routes, started by `bot.py`.
+    """
+    app = Application(title="Data Loader Bot")
+    setup_logging(app)
+    setup_lifecycle(app)
+    setup_store(app)
+    return app
@@ -1,10 +1,12 @@
 import logging
 
+from core.lifecycle import LifecycleManager
 from core.settings import AppSettings
 from fastapi import FastAPI
 from fastapi import Request as FastAPIRequest
 
 from store.bot.accessor import TgBotAccessor
+from store.http_client.accessor import HttpClientAccessor
 from store.store import Store
 
 
@@ -26,6 +28,8 @@ class Application(FastAPI):
     logger: logging.Logger
     docs_url: str
     bot: TgBotAccessor
+    http: HttpClientAccessor
+    lifecycle: LifecycleManager
 
 
 class Request(FastAPIRequest):
@@ -1,10 +1,12 @@
 import logging
 
+from core.lifecycle import LifecycleManager
 from core.settings import AppSettings
 from fastapi import FastAPI
 from fastapi import Request as FastAPIRequest
 
 from store.bot.accessor import TgBotAccessor
+from store.http_client.accessor import HttpClientAccessor
 from store.store import Store
 
 class Application(FastAPI):
@@ -19,6 +21,8 @@ class Application(FastAPI):
         logger (logging.Logger): The application logger.
         docs_url (str): The URL of the documentation.
         bot (TgBotAccessor): The telegram application/
+        http (HttpClientAccessor): The shared HTTP client.
+        lifecycle (LifecycleManager): The manager of the startup and shutdown of the accessors.
     """
 
     store: Store
@@ -26,6 +30,8 @@ class Application(FastAPI):
     logger: logging.Logger
     docs_url: str
     bot: TgBotAccessor
+    http: HttpClientAccessor
+    lifecycle: LifecycleManager
 
 class Request(FastAPIRequest):
     """Request overrides.
@@ -1,98 +1,197 @@
 import traceback
+from dataclasses import dataclass
+from functools import cached_property
 from logging import Logger
+from typing import Callable, Optional
 
+from base.base_exception import ExceptionBase
 from base.base_helper import HTTP_EXCEPTION, LOG_LEVEL
-from httpcore import URL
+from fastapi.exceptions import HTTPException
 from starlette import status
+from starlette.datastructures import URL
 from starlette.responses import JSONResponse
 
+from store.job_queue.exception import JobQueueFullException
+from store.ya_disk.exception import YaTokenNotValidException
+
+UNKNOWN_ERROR = "Unknown error..."
+
+# The status code and the log level of the exception classes, the most specific class is used.
+# The status code None means the status code of the exception, the level None means the configured level.
+EXCEPTION_TABLE: dict[type[Exception], tuple[Optional[int], Optional[LOG_LEVEL]]] = {
+    HTTPException: (None, None),
+    JobQueueFullException: (status.HTTP_503_SERVICE_UNAVAILABLE, "WARNING"),
+    YaTokenNotValidException: (status.HTTP_500_INTERNAL_SERVER_ERROR, "ERROR"),
+    ExceptionBase: (status.HTTP_400_BAD_REQUEST, None),
+    Exception: (status.HTTP_500_INTERNAL_SERVER_ERROR, "CRITICAL"),
+}
+
+
+class LazyMessage:
+    """The log message that is built only when the logger outputs it.
+
+    Args:
+        build (Callable[[], str]): A function that builds the message.
+    """
+
+    def __init__(self, build: Callable[[], str]):
+        self.build = build
+
+    def __str__(self) -> str:
+        return self.build()
+
+
+@dataclass(frozen=True)
+class ErrorContext:
+    """The error of one request.
+
+    Attributes:
+        exception (Exception): The exception that was raised.
+        url (URL): The URL of the request that caused the exception.
+        status_code (int): The status code of the response.
+        level (LOG_LEVEL): The level of the log message.
+        message (str): The message to the user.
+    """
+
+    exception: Exception
+    url: URL
+    status_code: int
+    level: LOG_LEVEL
+    message: str
+
+    @cached_property
+    def traceback(self) -> str:
+        """The formatted traceback of the exception, it is formatted on the first access."""
+        return "".join(traceback.format_exception(self.exception))
+
+    @property
+    def summary(self) -> str:
+        """The short description of the error for the log."""
+        summary = (
+            f"url={self.url}, exception={self.exception.__class__}, "
+            f"message_to_user={self.message}"
+        )
+        if real_exception := getattr(self.exception, "exception", None):
+            summary += f", real exception={real_exception!r}"
+        return summary
+
 
 class ExceptionHandler:
     """This class is used to handle all exceptions that occur in the application.
     It provides a standardized way to log and return errors to the user.
 
+    The handler keeps no state of the handled requests, so one instance serves all the requests.
+    The status code and the log level of an exception class are looked up in `EXCEPTION_TABLE` once.
+
     Args:
-        log_level (LOG_LEVEL, optional): The log level to use. Defaults to "INFO".
-        is_traceback (bool, optional): To enable or not to enable backtracking in the response.
+        log_level (LOG_LEVEL, optional): The log level of the application errors. Defaults to "INFO".
+        is_traceback (bool, optional): To enable or not to enable the traceback in the log.
         By default, the value is set to False.
     """
 
     def __init__(self, log_level: LOG_LEVEL = "INFO", is_traceback: bool = False):
-        self.exception = Exception("Unknown error...")
         self.level = log_level
-        self.logger = Logger(__name__)
-        self.message = "Unknown error..."
-        self.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         self.is_traceback = is_traceback
+        self._table: dict[type[Exception], tuple[Optional[int], LOG_LEVEL]] = {}
 
     def __call__(
         self,
         exception: Exception,
         url: URL,
-        logger: Logger = None,
-        is_traceback: bool = False,
+        logger: Logger,
+        is_traceback: Optional[bool] = None,
     ) -> JSONResponse:
         """This method is used to handle an exception.
 
         Args:
             exception (Exception): The exception that was raised.
             url (URL): The URL of the request that caused the exception.
-            logger (Logger, optional): The logger to use. Defaults to None.
-            is_traceback (bool, optional): To enable or not to enable backtracking in the response.
-            By default, the value is set to False.
+            logger (Logger): The logger to use.
+            is_traceback (bool, optional): To enable or not to enable the traceback in the log.
+            By default, the value set in the constructor is used.
 
         Returns:
             JSONResponse: A JSON response containing the error details.
         """
-        self.exception = exception
-        self.logger = logger
-        self.is_traceback = is_traceback
-        self.handler_exception()
-        return self.error_response(url)
+        context = self.make_context(exception, url)
+        self.log(context, logger, self.is_traceback if is_traceback is None else is_traceback)
+        return self.error_response(context)
 
-    def error_response(self, url: URL) -> JSONResponse:
-        """This method is used to create an error response.
+    def make_context(self, exception: Exception, url: URL) -> ErrorContext:
+        """Creates the error context of the request.
 
         Args:
+            exception (Exception): The exception that was raised.
             url (URL): The URL of the request that caused the exception.
 
+        Returns:
+            ErrorContext: The error context.
+        """
+        status_code, level = self.lookup(type(exception))
+        if isinstance(exception, HTTPException):
+            status_code = status_code or exception.status_code
+            message = exception.detail
+        else:
+            message = exception.args[0] if exception.args else UNKNOWN_ERROR
+        return ErrorContext(exception, url, status_code, level, message)
+
+    def lookup(self, exception_class: type[Exception]) -> tuple[Optional[int], LOG_LEVEL]:
+        """Returns the status code and the log level of the exception class.
+
+        Args:
+            exception_class (type[Exception]): The class of the exception.
+
+        Returns:
+            tuple[Optional[int], LOG_LEVEL]: The status code, None for the status code
+            of the exception, and the log level.
+        """
+        if (entry := self._table.get(exception_class)) is None:
+            base = next(cls for cls in exception_class.__mro__ if cls in EXCEPTION_TABLE)
+            status_code, level = EXCEPTION_TABLE[base]
+            entry = self._table[exception_class] = status_code, level or self.level
+        return entry
+
+    @staticmethod
+    def error_response(context: ErrorContext) -> JSONResponse:
+        """This method is used to create an error response.
+
+        Args:
+            context (ErrorContext): The error context.
+
         Returns:
             JSONResponse: A JSON response containing the error details.
         """
         content_data = {
-            "detail": HTTP_EXCEPTION.get(self.status_code),
-            "message": self.message,
+            "detail": HTTP_EXCEPTION.get(context.status_code),
+            "message": context.message,
         }
-        if self.is_traceback:
-            msg = traceback.format_exc()
-        else:
-            msg = f"url={url}, exception={self.exception.__class__}, message_to_user={self.exception}"
-        match self.level:
-            case "CRITICAL" | 50:
-                msg = (
-                    f" \n_____________\n "
-                    f"WARNING: an error has occurred to which there is no correct response of the application."
-                    f" WE NEED TO RESPOND URGENTLY"
-                    f" \nExceptionHandler:  {str(self.exception)}\n"
-                    f" _____________\n" + traceback.format_exc()
-                )
-                self.logger.critical(msg)
-            case "ERROR" | 40:
-                self.logger.error(msg)
-            case "WARNING" | 30:
-                self.logger.warning(msg)
-            case _:
-                self.logger.info(msg)
-        return JSONResponse(content=content_data, status_code=self.status_code)
+        return JSONResponse(content=content_data, status_code=context.status_code)
 
-    def handler_exception(self):
-        """This method is used to handle the exception.
+    @staticmethod
+    def log(context: ErrorContext, logger: Logger, is_traceback: bool):
+        """Logs the error, the traceback is formatted only if the message is output.
 
-        It sets the status code, message, and level based on the exception.
+        Args:
+            context (ErrorContext): The error context.
+            logger (Logger): The logger to use.
+            is_traceback (bool): To enable or not to enable the traceback in the log.
         """
-        if self.exception.args:
-            self.message = self.exception.args[0]
-        self.status_code = status.HTTP_400_BAD_REQUEST
-        message = self.exception.__class__.__name__
-        if ex := getattr(self.exception, "exception", False):
-            message += f" real exception={ex.args}"
+        match context.level:
+            case "CRITICAL" | "FATAL" | 50:
+                logger.critical(
+                    LazyMessage(
+                        lambda: f" \n_____________\n "
+                        f"WARNING: an error has occurred to which there is no correct response of the application."
+                        f" WE NEED TO RESPOND URGENTLY"
+                        f" \nExceptionHandler:  {context.summary}\n"
+                        f" _____________\n" + context.traceback
+                    )
+                )
+                return
+            case "ERROR" | 40:
+                log = logger.error
+            case "WARNING" | "WARN" | 30:
+                log = logger.warning
+            case _:
+                log = logger.info
+        log(LazyMessage(lambda: context.traceback if is_traceback else context.summary))
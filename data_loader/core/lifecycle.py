@@ -0,0 +1,136 @@
+"""Startup and shutdown of the application components."""
+
+import asyncio
+import time
+
+from core.settings import LifecycleSettings, get_settings
+
+
+class LifecycleManager:
+    """Connects and disconnects the components of the application in the order of their dependencies.
+
+    Every component declares the names of the components it depends on in `dependencies`,
+    the name of a component is the name of its class. A component is connected as soon as
+    all its dependencies are connected, so the independent components are connected concurrently.
+    The dependencies that are not part of the application are ignored.
+    On shutdown, a component is disconnected after all the components that depend on it.
+    A component whose connection was started is disconnected even if it failed to connect,
+    so its `disconnect` must tolerate a half-initialised state.
+
+    Args:
+        app (Application): The application.
+    """
+
+    def __init__(self, app):
+        self.logger = app.logger
+        self.settings = get_settings(LifecycleSettings)
+        self._components: dict[str, object] = {}
+        self._connected: list[str] = []
+
+    def dependencies(self, name: str) -> list[str]:
+        """Returns the names of the registered components the component depends on.
+
+        Args:
+            name (str): The name of the component.
+
+        Returns:
+            list[str]: The names of the dependencies.
+        """
+        return [
+            dependency
+            for dependency in self._components[name].dependencies
+            if dependency in self._components
+        ]
+
+    def register(self, component):
+        """Adds the component to the application.
+
+        Args:
+            component (BaseAccessor): The component, it has `connect` and `disconnect` methods
+                and the `dependencies` attribute.
+        """
+        self._components[type(component).__name__] = component
+
+    async def startup(self):
+        """Connects all the components.
+
+        If a component fails to connect or times out, the connected components are disconnected
+        and the error is raised.
+        """
+        self.__check_dependencies()
+        started_at = time.monotonic()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def connect(name: str):
+            component = self._components[name]
+            await asyncio.gather(*[tasks[dependency] for dependency in self.dependencies(name)])
+            connect_started_at = time.monotonic()
+            self._connected.append(name)
+            await asyncio.wait_for(component.connect(), self.settings.connect_timeout)
+            self.logger.info(f"{name} connected in {time.monotonic() - connect_started_at:.2f} s")
+
+        for name in self._components:
+            tasks[name] = asyncio.create_task(connect(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException as error:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            self.logger.error(f"Startup failed, {error!r}")
+            await self.shutdown()
+            raise
+        self.logger.info(f"Application started in {time.monotonic() - started_at:.2f} s")
+
+    async def shutdown(self):
+        """Disconnects the components whose connection was started, the errors are logged."""
+        connected = self._connected
+        self._connected = []
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def disconnect(name: str):
+            await asyncio.gather(
+                *[
+                    tasks[dependent]
+                    for dependent in connected
+                    if name in self.dependencies(dependent)
+                ]
+            )
+            try:
+                await asyncio.wait_for(
+                    self._components[name].disconnect(), self.settings.disconnect_timeout
+                )
+            except Exception as error:
+                self.logger.error(f"{name} failed to disconnect, {error!r}")
+
+        for name in connected:
+            tasks[name] = asyncio.create_task(disconnect(name))
+        await asyncio.gather(*tasks.values())
+
+    def __check_dependencies(self):
+        visited, path = set(), []
+
+        def visit(name: str):
+            if name in path:
+                raise ValueError(f"Circular dependency: {' -> '.join([*path, name])}")
+            if name in visited:
+                return
+            path.append(name)
+            for dependency in self.dependencies(name):
+                visit(dependency)
+            path.pop()
+            visited.add(name)
+
+        for name in self._components:
+            visit(name)
+
+
+def setup_lifecycle(app):
+    """Creates the lifecycle manager and runs it on the startup and shutdown of the application.
+
+    Args:
+        app (Application): The application.
+    """
+    app.lifecycle = LifecycleManager(app)
+    app.on_event("startup")(app.lifecycle.startup)
+    app.on_event("shutdown")(app.lifecycle.shutdown)
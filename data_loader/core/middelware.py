@@ -1,20 +1,198 @@
-import re
+from collections import OrderedDict
+from typing import Optional
 
 from core.components import Application
 from core.exception_handler import ExceptionHandler
-from core.settings import LogSettings
+from base.base_helper import HTTP_EXCEPTION
+from core.settings import FileSettings, LogSettings, get_settings
+from downloader.views import UPLOAD_PATHS
 from fastapi import Request as FastApiRequest
-from fastapi import Response, status
+from fastapi import status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.types import ASGIApp
+from starlette.datastructures import URL, Headers
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+ROUTE_CACHE_SIZE = 1024
+MULTIPART_OVERHEAD = 64 * 1024
+SNIFF_SIZE = 8 * 1024
+EXCEL_SIGNATURES = (b"PK\x03\x04", b"\xd0\xcf\x11\xe0")
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+
+class UploadRejectedException(HTTPException):
+    """The upload is rejected before the whole body is received, the connection is closed."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail, headers={"Connection": "close"})
+
+
+class UploadLimitMiddleware:
     """
-    Custom middleware for handling exceptions and errors in the FastAPI application.
+    ASGI middleware that rejects the uploads as soon as they are known to be invalid.
+
+    A request is rejected by its `Content-Length` header before the body is read,
+    and the received bytes are counted, so a request without the header is rejected
+    as soon as it exceeds the limit. The beginning of the first uploaded file is checked
+    for the signature of an excel file in the first received chunks.
+
+    Args:
+        app (ASGIApp): The FastAPI application.
+        paths (tuple[str, ...]): The paths of the upload endpoints.
+    """
+
+    def __init__(self, app: ASGIApp, paths: tuple[str, ...]):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Passes the upload request to the application, counting and checking the received body.
+
+        Args:
+            scope (Scope): The ASGI connection scope.
+            receive (Receive): The ASGI receive channel.
+            send (Send): The ASGI send channel.
+        """
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        max_size = get_settings(FileSettings).size
+        limit = max_size + MULTIPART_OVERHEAD
+        too_large = f"Too large file to upload, maximum size {max_size // 1024 // 1024} MB"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            error = UploadRejectedException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, too_large)
+            await upload_rejected_handler(FastApiRequest(scope), error)(scope, receive, send)
+            return
+        received = 0
+        head: Optional[bytearray] = bytearray()
+
+        async def receive_wrapper() -> Message:
+            nonlocal received, head
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            body = message.get("body", b"")
+            received += len(body)
+            if received > limit:
+                raise UploadRejectedException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, too_large)
+            if head is not None:
+                head += body
+                if (signature := self.sniff(head)) is not None:
+                    head = None
+                    if not signature:
+                        raise UploadRejectedException(
+                            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            "Invalid file type. The `xls` or `xlsx` type is expected.",
+                        )
+            return message
+
+        await self.app(scope, receive_wrapper, send)
+
+    @staticmethod
+    def sniff(head: bytes) -> Optional[bool]:
+        """Checks the signature of the first file of the multipart body.
+
+        Args:
+            head (bytes): The beginning of the multipart body.
+
+        Returns:
+            Optional[bool]: Whether the file has the signature of an excel file,
+            or None if the body is too short to tell yet.
+        """
+        headers_end = head.find(b"\r\n\r\n")
+        if headers_end < 0:
+            return None if len(head) < SNIFF_SIZE else True
+        if b"filename=" not in head[:headers_end]:
+            return True
+        content = bytes(head[headers_end + 4: headers_end + 8])
+        if len(content) < 4:
+            return None if len(head) < SNIFF_SIZE else True
+        return content in EXCEL_SIGNATURES
+
+
+class RouteIndex:
+    """The index of the application routes, used to reject the requests to unknown endpoints.
+
+    The routes without parameters are looked up by their path, and the routes with parameters
+    are grouped by the first segment of their path, so only a few of them are matched
+    against the path. The routes whose first segment has a parameter are matched against every path.
+    The methods of all the routes matching the path are allowed.
+    The decisions are cached for the last `cache_size` method and path pairs.
+
+    Args:
+        routes (list[BaseRoute]): The routes of the application.
+        cache_size (int, optional): Maximum number of cached decisions. Defaults to ROUTE_CACHE_SIZE.
+    """
+
+    def __init__(self, routes: list[BaseRoute], cache_size: int = ROUTE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._static: dict[str, Optional[set[str]]] = {}
+        # The routes whose first segment has a parameter are kept under the None key.
+        self._dynamic: dict[Optional[str], list[tuple]] = {}
+        self._decisions: OrderedDict[tuple[str, str], int] = OrderedDict()
+        for route in routes:
+            path = getattr(route, "path", None)
+            methods = getattr(route, "methods", None)
+            if path is None:
+                continue
+            if getattr(route, "param_convertors", None):
+                segment = self.__first_segment(path)
+                self._dynamic.setdefault(None if "{" in segment else segment, []).append(
+                    (route.path_regex, methods)
+                )
+            elif path in self._static:
+                known = self._static[path]
+                self._static[path] = None if known is None or methods is None else known | methods
+            else:
+                self._static[path] = methods
+
+    def match(self, method: str, path: str) -> int:
+        """Checks whether the request can be handled by the routes.
+
+        Args:
+            method (str): The method of the request.
+            path (str): The path of the request.
+
+        Returns:
+            int: HTTP 200 if the endpoint exists, HTTP 404 or HTTP 405 otherwise.
+        """
+        key = method, path
+        if (decision := self._decisions.get(key)) is not None:
+            self._decisions.move_to_end(key)
+            return decision
+        decision = self.__match(method, path)
+        self._decisions[key] = decision
+        if len(self._decisions) > self.cache_size:
+            self._decisions.popitem(last=False)
+        return decision
+
+    def __match(self, method: str, path: str) -> int:
+        allowed = []
+        if path in self._static:
+            allowed.append(self._static[path])
+        for segment in (self.__first_segment(path), None):
+            for path_regex, methods in self._dynamic.get(segment, ()):
+                if path_regex.match(path):
+                    allowed.append(methods)
+        if not allowed:
+            return status.HTTP_404_NOT_FOUND
+        if any(methods is None or method in methods for methods in allowed):
+            return status.HTTP_200_OK
+        return status.HTTP_405_METHOD_NOT_ALLOWED
+
+    @staticmethod
+    def __first_segment(path: str) -> str:
+        return path.split("/", 2)[1] if path.startswith("/") else ""
+
+
+class ErrorHandlingMiddleware:
+    """
+    Custom ASGI middleware for handling exceptions and errors in the FastAPI application.
+
+    The requests to unknown endpoints are rejected before they reach the application.
+    The route index is built on the first request, when all the routes are registered.
 
     Args:
         app (ASGIApp): The FastAPI application.
@@ -22,45 +200,52 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
     Attributes:
         settings (LogSettings): The log application settings.
         exception_handler (ExceptionHandler): The exception handler.
+        route_index (RouteIndex): The index of the application routes.
     """
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.settings = LogSettings()
+        self.app = app
+        self.settings = get_settings(LogSettings)
         self.exception_handler = ExceptionHandler(
             self.settings.level, self.settings.traceback
         )
+        self.route_index: Optional[RouteIndex] = None
 
-    async def dispatch(
-        self, request: FastApiRequest, call_next: RequestResponseEndpoint
-    ) -> Response:
-        """Dispatch the request to the next middleware or the application.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Passes the request to the application and turns the exceptions into error responses.
 
         Args:
-            request (FastApiRequest): The incoming request.
-            call_next (RequestResponseEndpoint): The next middleware or the
-                application.
+            scope (Scope): The ASGI connection scope.
+            receive (Receive): The ASGI receive channel.
+            send (Send): The ASGI send channel.
 
         Raises:
-            Exception: Any exception raised by the next middleware or the
-                application.
-
-        Returns:
-            Response: The response from the next middleware or the application.
+            Exception: Any exception raised by the application after the response has started.
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        response_started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            response_started = True
+            await send(message)
+
         try:
-            self.is_endpoint(request)
-            response = await call_next(request)
-            return response
+            self.is_endpoint(scope)
+            await self.app(scope, receive, send_wrapper)
         except Exception as error:
-            return self.exception_handler(error, request.url, request.app.logger)
+            if response_started:
+                raise
+            response = self.exception_handler(error, URL(scope=scope), scope["app"].logger)
+            await response(scope, receive, send)
 
-    @staticmethod
-    def is_endpoint(request: FastApiRequest) -> bool:
+    def is_endpoint(self, scope: Scope) -> bool:
         """Check if the request is an endpoint.
 
         Args:
-            request (FastApiRequest): The incoming request.
+            scope (Scope): The ASGI connection scope.
 
         Raises:
             HTTPException: If the request is not an endpoint.
@@ -68,24 +253,20 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
         Returns:
             bool: Whether the request is an endpoint.
         """
-        detail = "{message}, See the documentation: http://{host}:{port}{uri}"  # noqa
-        message = "Not Found"
-        status_code = status.HTTP_404_NOT_FOUND
-        for route in request.app.routes:
-            if re.match(route.path_regex, request.url.path):
-                if request.method.upper() in route.methods:
-                    return True
-                status_code = status.HTTP_405_METHOD_NOT_ALLOWED
-                message = "Method Not Allowed"
-                break
+        app = scope["app"]
+        if self.route_index is None:
+            self.route_index = RouteIndex(app.routes)
+        status_code = self.route_index.match(scope["method"].upper(), scope["path"])
+        if status_code == status.HTTP_200_OK:
+            return True
+        message = (
+            "Method Not Allowed"
+            if status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+            else "Not Found"
+        )
         raise HTTPException(
             status_code,
-            detail.format(
-                message=message,
-                host=request.app.settings.app_server_host,
-                port=request.app.settings.app_port_dl,
-                uri=request.app.docs_url,
-            ),
+            f"{message}, See the documentation: {app.settings.base_url}{app.docs_url}",
         )
 
 
@@ -109,6 +290,23 @@ async def validation_exception_handler(
     )
 
 
+def upload_rejected_handler(_: FastApiRequest, exc: UploadRejectedException) -> JSONResponse:
+    """Custom exception handler for the rejected uploads.
+
+    Args:
+        _ (FastApiRequest): The incoming request.
+        exc (UploadRejectedException): The raised exception.
+
+    Returns:
+        JSONResponse: A JSON response with the error details, the connection is closed after it.
+    """
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": HTTP_EXCEPTION.get(exc.status_code), "message": exc.detail},
+        headers=exc.headers,
+    )
+
+
 def setup_middleware(app: Application):
     """Sets up the middleware for the FastAPI application.
 
@@ -119,4 +317,6 @@ def setup_middleware(app: Application):
         Exception: If the middleware cannot be set up.
     """
     app.exception_handler(RequestValidationError)(validation_exception_handler)
+    app.exception_handler(UploadRejectedException)(upload_rejected_handler)
     app.add_middleware(ErrorHandlingMiddleware)
+    app.add_middleware(UploadLimitMiddleware, paths=UPLOAD_PATHS)
@@ -1,6 +1,8 @@
 """All application settings."""
 
 import os
+import threading
+from typing import Callable, Literal, Optional, TypeVar
 
 from base.base_helper import LOG_LEVEL
 from pydantic import AnyUrl, field_validator
@@ -20,6 +22,7 @@ class Base(BaseSettings):
         env_file = os.path.join(BASE_DIR, ".env_data_loader")
         enf_file_encoding = "utf-8"
         extra = "ignore"
+        frozen = True
 
 
 class UvicornSettings(Base):
@@ -62,6 +65,9 @@ class AppSettings(Base):
         docs_url (str): The URL for the application's documentation.
         redoc_url (str): The URL for the application's redoc.
         openapi_url (str): The URL for the application's openapi.json.
+        bot_mode (str, optional): "embedded" runs the Telegram bot and the uploads in the web application,
+            "process" runs them in the separate bot process (bot.py), so the web application
+            can run many workers. Defaults to "embedded".
     """
 
     title: str = "Data Loader"
@@ -70,6 +76,7 @@ class AppSettings(Base):
     docs_url: str = "/docs"
     redoc_url: str = "/redoc"
     openapi_url: str = "/openapi.json"
+    bot_mode: Literal["embedded", "process"] = "embedded"
 
     app_host: str
     app_port: int
@@ -97,8 +104,43 @@ class LogSettings(Base):
     traceback: bool = True
 
 
+class LifecycleSettings(Base):
+    """Application components lifecycle settings.
+
+    Args:
+        connect_timeout (float, optional): Maximum time in seconds to connect one component.
+            Defaults to 60.
+        disconnect_timeout (float, optional): Maximum time in seconds to disconnect one component.
+            Defaults to 30.
+    """
+
+    connect_timeout: float = 60
+    disconnect_timeout: float = 30
+
+
 class FileSettings(Base):
+    """Uploaded file settings.
+
+    Args:
+        size (int, optional): Maximum size of the uploaded file in bytes. Defaults to 10 Mb.
+        chunk_size (int, optional): The size of the chunk in which the file is streamed
+            to the cloud. Defaults to 1 Mb.
+        prefetch_count (int, optional): Maximum number of chunks read ahead of the transfer.
+            Defaults to 4.
+        min_chunk_size (int, optional): Minimum size of the transferred chunk. Defaults to 256 Kb.
+        max_chunk_size (int, optional): Maximum size of the transferred chunk. Defaults to 8 Mb.
+        max_uncompressed_size (int, optional): Maximum size of the unpacked xlsx file. Defaults to 200 Mb.
+        max_compression_ratio (int, optional): Maximum compression ratio of a part of the xlsx file,
+            a higher ratio is taken for a zip bomb. Defaults to 200.
+    """
+
     size: int = 1024 * 1024 * 10
+    chunk_size: int = 1024 * 1024
+    prefetch_count: int = 4
+    min_chunk_size: int = 256 * 1024
+    max_chunk_size: int = 1024 * 1024 * 8
+    max_uncompressed_size: int = 1024 * 1024 * 200
+    max_compression_ratio: int = 200
 
 
 class YaDiskSettings(Base):
@@ -109,21 +151,220 @@ class YaDiskSettings(Base):
         ya_client_id (str): Yandex OAuth2 client ID.
         ya_dir (str, optional): Yandex Disk directory ID. Defaults to "temp_folder".
         ya_attempt_count (int, optional): Number of attempts to download a file. Defaults to 10.
+        ya_token_ttl (float, optional): How long the verified token is considered valid,
+            in seconds. Defaults to 300.
     """
 
     ya_token: str
     ya_client_id: str
     ya_dir: str = "temp_folder"
     ya_attempt_count: int = 10
+    ya_token_ttl: float = 300
+
+
+class JobQueueSettings(Base):
+    """Background upload job queue settings.
+
+    Args:
+        job_workers (int, optional): Number of workers uploading files to the cloud. Defaults to 2.
+        job_queue_size (int, optional): Maximum number of jobs waiting for upload. Defaults to 100.
+        job_history_size (int, optional): Number of jobs whose status is kept. Defaults to 1000.
+        job_spool_dir (str, optional): The directory where accepted files wait for upload
+            and the job manifest is stored.
+        job_retry_count (int, optional): Number of attempts to upload a file. Defaults to 5.
+        job_retry_delay (float, optional): Delay before the first retry in seconds,
+            doubled after each attempt. Defaults to 5.
+        job_retry_max_delay (float, optional): Maximum delay between retries in seconds. Defaults to 300.
+        job_hash_index_size (int, optional): Maximum number of uploaded file hashes
+            remembered to detect duplicates. Defaults to 10000.
+        job_source_index_size (int, optional): Maximum number of remembered source IDs
+            of the uploaded files. Defaults to 10000.
+        job_poll_interval (float, optional): How often in seconds the consumer looks for
+            the jobs accepted by other processes. Defaults to 1, 0 disables it.
+    """
+
+    job_workers: int = 2
+    job_queue_size: int = 100
+    job_history_size: int = 1000
+    job_spool_dir: str = os.path.join(BASE_DIR, "spool")
+    job_retry_count: int = 5
+    job_retry_delay: float = 5
+    job_retry_max_delay: float = 300
+    job_hash_index_size: int = 10000
+    job_source_index_size: int = 10000
+    job_poll_interval: float = 1
+
+
+class HttpClientSettings(Base):
+    """Settings of the shared HTTP client used for all outbound requests.
+
+    Args:
+        http_limit (int, optional): Maximum number of open connections. Defaults to 100.
+        http_limit_per_host (int, optional): Maximum number of open connections to one host. Defaults to 10.
+        http_keepalive_timeout (float, optional): How long an idle connection is kept open,
+            in seconds. Defaults to 30.
+        http_dns_ttl (int, optional): How long resolved host addresses are cached, in seconds. Defaults to 300.
+        http_connect_timeout (float, optional): Connection timeout in seconds. Defaults to 10.
+        http_read_timeout (float, optional): Timeout for reading a portion of the response
+            in seconds. Defaults to 60.
+    """
+
+    http_limit: int = 100
+    http_limit_per_host: int = 10
+    http_keepalive_timeout: float = 30
+    http_dns_ttl: int = 300
+    http_connect_timeout: float = 10
+    http_read_timeout: float = 60
 
 
 class TgSettings(Base):
+    """Telegram bot settings class.
+
+    Args:
+        tg_api_id (int): Telegram application ID.
+        tg_api_hash (str): Telegram application hash.
+        tg_bot_token (str): Telegram bot token.
+        tg_admin_id (int): Telegram ID of the administrator.
+        tg_download_workers (int, optional): Number of parts of a document
+            downloaded at the same time. Defaults to 4.
+        tg_intake_workers (int, optional): Number of documents received at the same time.
+            Defaults to 4.
+        tg_intake_queue_size (int, optional): Maximum number of documents waiting
+            to be received. Defaults to 50.
+        tg_user_concurrency (int, optional): Number of documents of one user
+            received at the same time. Defaults to 2.
+        tg_document_cache_size (int, optional): Maximum number of remembered reports
+            sent to Telegram, which are re-sent without uploading. Defaults to 128.
+        tg_global_rate (float, optional): Maximum number of outbound requests per second
+            of the bot. Defaults to 25.
+        tg_chat_rate (float, optional): Maximum number of outbound requests per second
+            to one chat. Defaults to 1.
+        tg_chat_burst (int, optional): Number of outbound requests to one chat
+            sent without pacing. Defaults to 3.
+        tg_commands_state_path (str, optional): The path to the file of the bot commands
+            synced last. Defaults to "bot_commands.json" in the base directory.
+        tg_commands_sync_delay (float, optional): The time in seconds the updates of the bot
+            commands are collected before the sync. Defaults to 0.5.
+        tg_stats_interval (float, optional): The interval in seconds the statistics of the outbound
+            scheduler are logged at the DEBUG level, 0 disables the log. Defaults to 60.
+    """
+
     tg_api_id: int
     tg_api_hash: str
     tg_bot_token: str
     tg_admin_id: int
+    tg_download_workers: int = 4
+    tg_intake_workers: int = 4
+    tg_intake_queue_size: int = 50
+    tg_user_concurrency: int = 2
+    tg_document_cache_size: int = 128
+    tg_global_rate: float = 25
+    tg_chat_rate: float = 1
+    tg_chat_burst: int = 3
+    tg_commands_state_path: str = os.path.join(BASE_DIR, "bot_commands.json")
+    tg_commands_sync_delay: float = 0.5
+    tg_stats_interval: float = 60
+
+
+class ReportCacheSettings(Base):
+    """Settings of the report cache.
+
+    Args:
+        report_cache_ttl (float, optional): How long the report is kept, in seconds. Defaults to 60.
+        report_cache_size (int, optional): Maximum number of reports kept in memory. Defaults to 32.
+        report_cache_dir (str, optional): The directory where the reports are also stored on disk.
+            Defaults to None, the reports are kept only in memory.
+        report_incremental (bool, optional): Whether to compose the reports for several days
+            from the reports for each day. Defaults to False.
+        report_recent_days (int, optional): Number of the last days whose reports may still change
+            and are dropped when a new file is uploaded. Defaults to 2.
+        report_day_ttl (float, optional): How long the report for an earlier day is kept,
+            in seconds, a back-dated upload is not reflected in it until then. Defaults to 86400.
+        report_day_cache_size (int, optional): Maximum number of the reports for a day
+            kept in memory. Defaults to 400.
+        report_refresh_interval (float, optional): How often the reports for the standard periods
+            are fetched in advance, in seconds. Defaults to 300, 0 disables the refresh.
+        report_refresh_delay (float, optional): The time in seconds without uploads
+            after which the reports are refreshed, the uploads in a burst cause one refresh,
+            at most `report_refresh_interval` later. Defaults to 30.
+        report_spool_size (int, optional): The size above which the report is kept on disk
+            instead of memory, in bytes. Defaults to 4 Mb.
+    """
+
+    report_cache_ttl: float = 60
+    report_cache_size: int = 32
+    report_cache_dir: Optional[str] = None
+    report_incremental: bool = False
+    report_recent_days: int = 2
+    report_day_ttl: float = 60 * 60 * 24
+    report_day_cache_size: int = 400
+    report_refresh_interval: float = 300
+    report_refresh_delay: float = 30
+    report_spool_size: int = 1024 * 1024 * 4
 
 
 class ServiceSettings(Base):
     base_url: str
     clicker_base_url: str = "http://0.0.0.0:8010"
+
+
+SettingsType = TypeVar("SettingsType", bound=Base)
+
+
+class SettingsRegistry:
+    """The registry of the settings, each settings class is read once per process.
+
+    The environment and the `.env_data_loader` file are read on the first request of a settings class,
+    and the same frozen instance is returned afterwards. `reload` reads the settings again
+    on the next request and calls the reload hooks, the instances given out earlier do not change.
+    """
+
+    def __init__(self):
+        self._settings: dict[type[Base], Base] = {}
+        self._hooks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, settings_class: type[SettingsType]) -> SettingsType:
+        """Returns the settings of the class.
+
+        Args:
+            settings_class (type[Base]): The settings class.
+
+        Returns:
+            Base: The frozen settings instance.
+        """
+        if (settings := self._settings.get(settings_class)) is None:
+            with self._lock:
+                if (settings := self._settings.get(settings_class)) is None:
+                    settings = self._settings[settings_class] = settings_class()
+        return settings
+
+    def reload(self):
+        """Drops the read settings and calls the reload hooks."""
+        with self._lock:
+            self._settings.clear()
+        for hook in self._hooks:
+            hook()
+
+    def on_reload(self, hook: Callable[[], None]):
+        """Adds the function that is called after the settings are reloaded.
+
+        Args:
+            hook (Callable[[], None]): The function.
+        """
+        self._hooks.append(hook)
+
+
+settings_registry = SettingsRegistry()
+
+
+def get_settings(settings_class: type[SettingsType]) -> SettingsType:
+    """Returns the settings of the class from the settings registry.
+
+    Args:
+        settings_class (type[Base]): The settings class.
+
+    Returns:
+        Base: The frozen settings instance.
+    """
+    return settings_registry.get(settings_class)
@@ -1,13 +1,75 @@
-from typing import Any, Callable, Type
+import re
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Optional, Type
 
 import filetype
-from core.settings import FileSettings
+from core.settings import FileSettings, get_settings
 from fastapi import File
-from pydantic import BaseModel, GetJsonSchemaHandler
+from pydantic import BaseModel, ConfigDict, GetJsonSchemaHandler
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import CoreSchema
 from pydantic_core.core_schema import with_info_plain_validator_function
 from starlette.datastructures import UploadFile
+from store.job_queue.job import JobState
+
+WORKBOOK_NAME = "xl/workbook.xml"
+WORKSHEET_PATTERN = re.compile(r"xl/worksheets/sheet\d+\.xml")
+MAX_ENTRIES = 10000
+
+
+@dataclass(frozen=True)
+class WorkbookInfo:
+    """The structure of the uploaded xlsx workbook.
+
+    Attributes:
+        sheet_count (int): The number of worksheets.
+        uncompressed_size (int): The total size of the unpacked workbook in bytes.
+    """
+
+    sheet_count: int
+    uncompressed_size: int
+
+
+def inspect_workbook(file: BinaryIO) -> WorkbookInfo:
+    """Checks the structure of the xlsx workbook by the central directory of its ZIP archive.
+
+    Only the central directory at the end of the file is read, the content of the workbook is not unpacked.
+
+    Args:
+        file (BinaryIO): The seekable file of the workbook.
+
+    Returns:
+        WorkbookInfo: The structure of the workbook.
+
+    Raises:
+        ValueError: If the file is not a valid xlsx workbook, or it unpacks into too much data.
+    """
+    settings = get_settings(FileSettings)
+    try:
+        with zipfile.ZipFile(file) as archive:
+            entries = archive.infolist()
+    except (zipfile.BadZipFile, EOFError) as error:
+        raise ValueError(f"Damaged xlsx file: {error}")
+    finally:
+        file.seek(0)
+    if len(entries) > MAX_ENTRIES:
+        raise ValueError(f"Too many parts in the xlsx file: {len(entries)}")
+    names = {entry.filename for entry in entries}
+    if WORKBOOK_NAME not in names:
+        raise ValueError(f"Invalid xlsx file: {WORKBOOK_NAME} is missing")
+    sheet_count = sum(bool(WORKSHEET_PATTERN.fullmatch(name)) for name in names)
+    if not sheet_count:
+        raise ValueError("Invalid xlsx file: there are no worksheets")
+    uncompressed_size = sum(entry.file_size for entry in entries)
+    if uncompressed_size > settings.max_uncompressed_size:
+        max_size = settings.max_uncompressed_size // 1024 // 1024
+        raise ValueError(f"The xlsx file unpacks into more than {max_size} MB")
+    for entry in entries:
+        if entry.file_size > max(entry.compress_size, 1) * settings.max_compression_ratio:
+            raise ValueError(f"Suspicious compression ratio of {entry.filename} in the xlsx file")
+    return WorkbookInfo(sheet_count, uncompressed_size)
 
 
 class UploadFileSchema(UploadFile):
@@ -34,6 +96,8 @@ class UploadFileSchema(UploadFile):
                starlette.datastructures.UploadFile.
             2. The file size is less than the maximum allowed size.
             3. The file type is supported (i.e., .xlsx or .xls).
+            4. The xlsx file has a workbook and worksheets and is not a zip bomb,
+               the structure is kept in the `workbook` attribute of the file.
 
         Args:
             file (File): The incoming file upload.
@@ -48,13 +112,17 @@ class UploadFileSchema(UploadFile):
         if not isinstance(file, UploadFile):
             raise ValueError(f"Expected UploadFile, received: {type(file)}")
 
-        file_size = FileSettings().size
+        file_size = get_settings(FileSettings).size
         if file.size > file_size:
             max_size = file_size // 1024 // 1024
             raise ValueError(f"Too large file to upload, maximum size {max_size} MB")
 
         if type_file := filetype.guess(file.file):
-            if type_file.extension in ["xlsx", "xls"]:
+            if type_file.extension == "xlsx":
+                file.workbook = inspect_workbook(file.file)
+                return file
+            if type_file.extension == "xls":
+                file.workbook = None
                 return file
             raise ValueError(
                 f"Invalid file type: {type_file.extension}. The `xls` or `xlsx`  type is expected."
@@ -108,6 +176,11 @@ class OkSchema(BaseModel):
     Attributes:
         status (str): The status of the response. Always "Ok" in this case.
         message (str): A brief message describing the outcome of the request.
+        job_id (str, optional): The ID of the upload job.
+        duplicate (bool): Whether the same file has already been uploaded.
+        path (str, optional): The path of the already uploaded file in the cloud.
+        sheet_count (int, optional): The number of worksheets of the xlsx file.
+        uncompressed_size (int, optional): The size of the unpacked xlsx file in bytes.
     """
 
     status: str = "Оk"
@@ -115,3 +188,47 @@ class OkSchema(BaseModel):
         "The data has been successfully added to the processing queue,"
         " and the results will be sent in a telegram."
     )
+    job_id: Optional[str] = None
+    duplicate: bool = False
+    path: Optional[str] = None
+    sheet_count: Optional[int] = None
+    uncompressed_size: Optional[int] = None
+
+
+class JobSchema(BaseModel):
+    """
+    Pydantic model for returning the status of the upload job.
+
+    Attributes:
+        id (str): The job ID.
+        file_name (str): The name of the uploaded file.
+        state (JobState): The state of the job.
+        size (int): The size of the file in bytes.
+        bytes_sent (int): The number of bytes sent to the cloud.
+        sha256 (str, optional): The SHA-256 hash of the file content.
+        duplicate (bool): Whether the same file has already been uploaded.
+        path (str, optional): The path of the file in the cloud.
+        error (str, optional): The error message if the job failed.
+        created_at (datetime): The time the job was accepted.
+        started_at (datetime, optional): The time the upload started.
+        finished_at (datetime, optional): The time the upload finished.
+        wait_time (float, optional): The time in seconds the job waited in the queue.
+        upload_time (float, optional): The time in seconds spent uploading the file.
+    """
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    file_name: str
+    state: JobState
+    size: int
+    bytes_sent: int
+    sha256: Optional[str] = None
+    duplicate: bool = False
+    path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    wait_time: Optional[float] = None
+    upload_time: Optional[float] = None
@@ -1,18 +1,21 @@
-from io import BytesIO
-from typing import Any
+from typing import Any, AsyncIterator, Callable
 
 from core.components import Request
-from downloader.schemes import OkSchema, UploadFileSchema
-from fastapi import APIRouter
+from core.settings import FileSettings, get_settings
+from downloader.schemes import JobSchema, OkSchema, UploadFileSchema
+from fastapi import APIRouter, HTTPException, status
+from starlette.datastructures import UploadFile
 
 downloader_route = APIRouter(prefix="/downloader", tags=["FILE"])
+UPLOAD_PATHS = ("/downloader/add_data_from_file",)
 
 
 @downloader_route.post(
     "/add_data_from_file",
     summary="Add data from file",
     description="Add `pl` or `can` data from an excel file. "
-    "Received data is processed immediately. <br>"
+    "Received data is added to the upload queue, "
+    "the status of the upload is available by the returned `job_id`. <br>"
     "Note: \n"
     " - Only the first sheet is processed.\n"
     " - The file size is limited.\n",
@@ -27,10 +30,72 @@ async def add_pl_from_file(request: "Request", file: UploadFileSchema) -> Any:
         file (UploadFileSchema): The file to be uploaded.
 
     Returns:
-        Any: Returns an OK schema with a message.
+        Any: Returns an OK schema with a message and the ID of the upload job.
 
     """
-    await request.app.store.ya_disk.upload_file(
-        BytesIO(await file.read()), file.filename
+    job = await request.app.store.job_queue.put(
+        make_async_iterator(file, get_settings(FileSettings).chunk_size), file.filename
     )
-    return OkSchema()
+    workbook = {}
+    if file.workbook:
+        workbook = dict(
+            sheet_count=file.workbook.sheet_count,
+            uncompressed_size=file.workbook.uncompressed_size,
+        )
+    if job.duplicate:
+        return OkSchema(
+            message="The file has already been uploaded.",
+            job_id=job.id,
+            duplicate=True,
+            path=job.path,
+            **workbook,
+        )
+    return OkSchema(job_id=job.id, **workbook)
+
+
+@downloader_route.get(
+    "/jobs/{job_id}",
+    summary="Upload job status",
+    description="Get the state, the number of bytes sent and the timings of the upload job.",
+    response_model=JobSchema,
+)
+async def get_job(request: "Request", job_id: str) -> Any:
+    """
+    This function is used to get the status of the upload job.
+
+    Args:
+        request (Request): The request object.
+        job_id (str): The ID of the upload job.
+
+    Returns:
+        Any: Returns a job schema.
+
+    """
+    if job := await request.app.store.job_queue.get(job_id):
+        return JobSchema.model_validate(job)
+    raise HTTPException(status.HTTP_404_NOT_FOUND, f"Job {job_id} not found")
+
+
+def make_async_iterator(
+    file: UploadFile, chunk_size: int
+) -> Callable[[], AsyncIterator[bytes]]:
+    """Creates an asynchronous iterator that reads the uploaded file chunk by chunk.
+
+    The file is read from the beginning each time the iterator is created,
+    so the upload can be safely repeated.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        chunk_size (int): The size of the chunk in bytes.
+
+    Returns:
+        Callable[[], AsyncIterator[bytes]]: A function that returns an asynchronous
+        iterator of bytes of the file.
+    """
+
+    async def iter_upload():
+        await file.seek(0)
+        while chunk := await file.read(chunk_size):
+            yield chunk
+
+    return iter_upload
@@ -1,10 +1,10 @@
 """The application launcher."""
 
 import uvicorn
-from core.settings import UvicornSettings
+from core.settings import UvicornSettings, get_settings
 
 if __name__ == "__main__":
-    settings = UvicornSettings()
+    settings = get_settings(UvicornSettings)
     uvicorn.run(
         app="core.app:setup_app",
         host=settings.host,
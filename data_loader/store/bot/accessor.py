@@ -1,19 +1,33 @@
-from typing import AsyncIterator, Awaitable, Callable, Coroutine, Optional
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Coroutine, Optional
 
-from aiohttp import ClientConnectorError
+from aiohttp import ClientError
 
 from base.base_accessor import BaseAccessor
-from core.settings import TgSettings
+from core.settings import TgSettings, get_settings
+from store.job_queue.exception import JobQueueException
+from store.bot.commands import CommandRegistry
+from store.bot.scheduler import GLOBAL, OutboundScheduler, Priority
+from store.job_queue.job import Job, JobState
 
-from telethon import TelegramClient, functions
+from telethon import TelegramClient, functions, utils
+from telethon.errors import RPCError
 from telethon.events import NewMessage
 from telethon.tl.types import (
     BotCommand,
     BotCommandScopeDefault,
+    InputDocument,
     InputDocumentFileLocation,
 )
 
 MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PART_SIZE = 1024 * 1024
+REQUEST_SIZE = 512 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
 PATTERN = "[0-9]{4}-(0[1-9]|1[012])-(0[1-9]|1[0-9]|2[0-9]|3[01])"
 
 
@@ -21,7 +35,11 @@ class TgBotAccessor(BaseAccessor):
     """This class is responsible for managing the Telegram Bot connection and handling various events."""
 
     DOC_INVALID_MSG = "Invalid file format, expected an excel file."
+    DOC_ACCEPTED_MSG = "Document received, uploading..."
+    DOC_BUSY_MSG = "Too many documents are being uploaded. Please try again later."
+    DOC_FAILED_MSG = "Document upload failed: {error}"
     DOC_SUCCESS_MSG = "Document successfully added to the queue for database insertion."
+    DOC_DUPLICATE_MSG = "Document has already been uploaded."
     UNKNOWN_COMMAND_MSG = "Unknown command or document."
     ERROR_MSG = "Something went wrong. Please try again later."
     ACCESS_DENIED_MSG = "Access Denied. Please contact the administrator."
@@ -31,12 +49,56 @@ class TgBotAccessor(BaseAccessor):
     bot: TelegramClient
     __commands: list[tuple[str, str, Callable[[], Coroutine]]]
     __command_handlers: dict[str, Callable[[], Coroutine[None, None, None]]]
+    _intake_queue: asyncio.Queue
+    _intake_workers: list[asyncio.Task]
+    _user_active: dict[int, int]
+    _user_waiting: dict[int, deque]
+    _followups: set[asyncio.Task]
+    _sent_documents: OrderedDict[tuple[str, str], InputDocument]
+    _stats_task: Optional[asyncio.Task]
+    scheduler: OutboundScheduler
+    command_registry: CommandRegistry
     lang_codes = ["ru", "en"]
 
+    def _init(self):
+        self._client = None
+        self.scheduler = None
+        self.command_registry = None
+        self._intake_workers = []
+        self._followups = set()
+        self._stats_task = None
+
     async def connect(self):
         self.__command_handlers = {}
         self.__commands = []
-        self.settings = TgSettings()
+        self.settings = get_settings(TgSettings)
+        self._intake_queue = asyncio.Queue(maxsize=self.settings.tg_intake_queue_size)
+        self._user_active = {}
+        self._user_waiting = {}
+        self._followups = set()
+        self._sent_documents = OrderedDict()
+        self.scheduler = OutboundScheduler(
+            self.settings.tg_global_rate,
+            self.settings.tg_chat_rate,
+            self.settings.tg_chat_burst,
+            self.logger,
+        )
+        self.scheduler.start()
+        self._stats_task = None
+        if self.settings.tg_stats_interval:
+            self._stats_task = asyncio.create_task(self.__log_stats())
+        self.command_registry = CommandRegistry(
+            self.__set_commands,
+            self.lang_codes,
+            self.settings.tg_commands_state_path,
+            self.settings.tg_commands_sync_delay,
+            self.logger,
+        )
+        await self.command_registry.load()
+        self._intake_workers = [
+            asyncio.create_task(self.__intake_worker())
+            for _ in range(self.settings.tg_intake_workers)
+        ]
         self._client = TelegramClient(
             "bot", api_hash=self.settings.tg_api_hash, api_id=self.settings.tg_api_id
         )
@@ -55,50 +117,141 @@ class TgBotAccessor(BaseAccessor):
         Returns:
             None: Returns nothing.
         """
+        tasks = [*self._intake_workers, *self._followups]
+        if self._stats_task:
+            tasks.append(self._stats_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.command_registry is not None:
+            await self.command_registry.close()
+        if self.scheduler is not None:
+            await self.scheduler.stop()
+        if self._client is not None:
+            await self._client.disconnect()
         self.logger.info("Telegram bot disconnected")
 
+    async def __log_stats(self):
+        while True:
+            await asyncio.sleep(self.settings.tg_stats_interval)
+            self.logger.debug(f"Outbound scheduler: {self.scheduler.stats}")
+
     async def event_handler(self, event):
         message = self.UNKNOWN_COMMAND_MSG
         file = None
         if event.document:
-            message = await self.__document_loader(event)
+            await self.__accept_document(event)
+            return
 
         elif handler := self.get_handler(event.raw_text):
             try:
                 file = await handler()
-            except ClientConnectorError:
+            except ClientError:
                 message = self.ERROR_MSG
 
-        await event.reply(message, file=file)
+        try:
+            if file is None:
+                await self.__reply(event, message)
+            else:
+                await self.__send_file(event, message, file)
+        finally:
+            if file is not None:
+                file.close()
+
+    async def __send_file(self, event, message: str, file: BinaryIO):
+        """Replies with the report, re-sending the document already uploaded to Telegram if possible.
+
+        The uploaded documents are remembered by the command and the hash of the content,
+        so a repeated delivery of the same report does not upload the file again.
+        """
+        key = event.raw_text, await asyncio.to_thread(self.__hash_file, file)
+        if document := self._sent_documents.get(key):
+            self._sent_documents.move_to_end(key)
+            try:
+                await self.__reply(event, message, file=document)
+                return
+            except RPCError as error:
+                self.logger.warning(f"Failed to re-send the document, {error}")
+                self._sent_documents.pop(key, None)
+        reply = await self.__reply(event, message, file=file)
+        if reply.document:
+            self._sent_documents[key] = utils.get_input_document(reply.document)
+            while len(self._sent_documents) > self.settings.tg_document_cache_size:
+                self._sent_documents.popitem(last=False)
+
+    @staticmethod
+    def __hash_file(file: BinaryIO) -> str:
+        sha256 = hashlib.sha256()
+        file.seek(0)
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+        file.seek(0)
+        return sha256.hexdigest()
 
     def get_handler(self, command: str) -> Optional[Callable[[], Awaitable]] | None:
         return self.__command_handlers.get(command)
 
     def make_async_iterator(
-            self, document: InputDocumentFileLocation
+            self, document: InputDocumentFileLocation, file_size: Optional[int] = None
     ) -> Callable[[], AsyncIterator[bytes]]:
         """Creates an asynchronous iterator that can be used to download a file from Telegram's cloud storage.
 
+        If the file size is known, the file is downloaded by parts of `PART_SIZE`,
+        up to `tg_download_workers` parts at the same time, and the parts are yielded in order.
+
         Parameters:
             document (telethon.tl.types.InputDocumentFileLocation): A Telethon object that
             represents the location of the file to download.
+            file_size (int, optional): The size of the file. Defaults to the size of the document, if any.
 
         Returns:
             Callable[[], AsyncIterator[bytes]]: A function that returns an asynchronous
             iterator of bytes that can be used to download the file.
         """
+        file_size = file_size or getattr(document, "size", None)
+        workers = self.settings.tg_download_workers
 
         async def iter_download():
             async for chunk in self.bot.iter_download(
-                    document, chunk_size=1024 * 1024 * 1
+                    document, chunk_size=PART_SIZE
             ):
                 yield chunk
 
+        async def iter_download_parallel():
+            parts = math.ceil(file_size / PART_SIZE)
+            tasks: dict[int, asyncio.Task] = {}
+            try:
+                for part in range(parts):
+                    for next_part in range(part + len(tasks), min(part + workers, parts)):
+                        tasks[next_part] = asyncio.create_task(
+                            self.__download_part(document, next_part, file_size)
+                        )
+                    yield await tasks.pop(part)
+            finally:
+                for task in tasks.values():
+                    task.cancel()
+
+        if file_size and workers > 1 and file_size > PART_SIZE:
+            return iter_download_parallel
         return iter_download
 
+    async def __download_part(self, document, part: int, file_size: int) -> bytes:
+        chunks = [
+            chunk
+            async for chunk in self.bot.iter_download(
+                document,
+                offset=part * PART_SIZE,
+                limit=1,
+                chunk_size=PART_SIZE,
+                request_size=REQUEST_SIZE,
+                file_size=file_size,
+            )
+        ]
+        return b"".join(chunks)
+
     async def add_commands(self, commands: list[tuple[str, str, Callable[[], Coroutine]]]):
         self.__commands.extend(commands)
-        await self.__update_commands()
+        self.__update_commands()
         self.__update_command_handlers()
 
     async def remove_commands(self, commands: list[tuple[str, str, Callable[[], Coroutine]]]):
@@ -109,39 +262,170 @@ class TgBotAccessor(BaseAccessor):
                 except ValueError:
                     self.logger.warning(f"Command {command[0]} not found")
                 self.__command_handlers.pop(f"/{command[0]}")
-        await self.__update_commands()
+        self.__update_commands()
+
+    def __update_commands(self):
+        self.command_registry.update(
+            [(command, description) for command, description, _ in self.__commands]
+        )
 
-    async def __update_commands(self):
-        [
-            await self._client(
+    async def __set_commands(self, lang_code: str, commands: list[tuple[str, str]]):
+        await self.scheduler.send(
+            GLOBAL,
+            lambda: self._client(
                 functions.bots.SetBotCommandsRequest(
                     scope=BotCommandScopeDefault(),
                     lang_code=lang_code,
                     commands=[
                         BotCommand(command=command, description=description)
-                        for command, description, _ in self.__commands
+                        for command, description in commands
                     ],
                 )
-            )
-            for lang_code in self.lang_codes
-        ]
+            ),
+            Priority.CONTROL,
+        )
 
     def __update_command_handlers(self):
         self.__command_handlers = {
             f"/{command}": handler for command, _, handler in self.__commands
         }
 
-    async def __document_loader(self, event) -> str:
-        message = self.DOC_INVALID_MSG
-        if event.document.mime_type == MIME_TYPE:
-            await self.app.store.ya_disk.download_to_cloud(
-                event.file.name, self.make_async_iterator(event.document)
+    @staticmethod
+    def get_source_id(document) -> str:
+        """Returns the stable ID of the Telegram document.
+
+        The document ID does not change when the document is forwarded or sent again.
+
+        Args:
+            document (telethon.tl.types.Document): The Telegram document.
+
+        Returns:
+            str: The source ID of the document.
+        """
+        return f"tg:{document.id}"
+
+    async def __accept_document(self, event):
+        """Acknowledges the document at once and puts it into the intake queue.
+
+        A document that has already been uploaded is answered at once without a transfer.
+        The document is downloaded by the intake workers, so the handler does not wait for the transfer.
+        """
+        if event.document.mime_type != MIME_TYPE:
+            self.logger.info(f"{self.DOC_INVALID_MSG}: filename {event.file.name}")
+            await self.__reply(event, self.DOC_INVALID_MSG)
+            return
+        if await self.app.store.job_queue.find_source(self.get_source_id(event.document)):
+            self.logger.info(f"{self.DOC_DUPLICATE_MSG}: filename {event.file.name}")
+            await self.__reply(event, self.DOC_DUPLICATE_MSG)
+            return
+        if self.intake_count >= self.settings.tg_intake_queue_size:
+            await self.__reply(event, self.DOC_BUSY_MSG)
+            return
+        reply = await self.__reply(event, self.DOC_ACCEPTED_MSG)
+        # The queue may have been filled by other documents while the reply was being sent.
+        if self.intake_count >= self.settings.tg_intake_queue_size:
+            await self.__edit(reply, self.DOC_BUSY_MSG)
+            return
+        self._intake_queue.put_nowait((event, reply))
+
+    @property
+    def intake_count(self) -> int:
+        """The number of documents waiting to be received, including the deferred documents of the users."""
+        deferred = sum(len(waiting) for waiting in self._user_waiting.values())
+        return self._intake_queue.qsize() + deferred
+
+    async def __intake_worker(self):
+        """Receives the documents from the intake queue.
+
+        A document of a user who already has `tg_user_concurrency` documents being received
+        is deferred instead of holding the worker, and it is received by the worker
+        that finishes the previous document of the user.
+        """
+        while True:
+            event, reply = await self._intake_queue.get()
+            self._intake_queue.task_done()
+            user_id = event.sender_id
+            if self._user_active.get(user_id, 0) >= self.settings.tg_user_concurrency:
+                self._user_waiting.setdefault(user_id, deque()).append((event, reply))
+                continue
+            self._user_active[user_id] = self._user_active.get(user_id, 0) + 1
+            try:
+                while True:
+                    await self.__receive_document(event, reply)
+                    if not (waiting := self._user_waiting.get(user_id)):
+                        break
+                    event, reply = waiting.popleft()
+                    if not waiting:
+                        del self._user_waiting[user_id]
+            finally:
+                self._user_active[user_id] -= 1
+                if not self._user_active[user_id]:
+                    del self._user_active[user_id]
+
+    async def __receive_document(self, event, reply):
+        try:
+            await self.__document_loader(event, reply)
+        except Exception as error:
+            self.logger.error(f"Document {event.file.name} failed, {error}")
+            await self.__edit(reply, self.ERROR_MSG)
+
+    async def __document_loader(self, event, reply):
+        started_at = time.time()
+        try:
+            job = await self.app.store.job_queue.put(
+                self.make_async_iterator(event.document), event.file.name
             )
-            message = self.DOC_SUCCESS_MSG
+        except JobQueueException as error:
+            return await self.__edit(reply, error.args[0])
+        download_time = time.time() - started_at
         self.logger.info(
-            f"{message}: filename{event.file.name}, size : {event.file.size / 1024 / 1024:.2} Mb"
+            f"Document accepted: filename {event.file.name}, "
+            f"size: {event.file.size / 1024 / 1024:.2f} Mb, download: {download_time:.1f} s"
+        )
+        if job.duplicate:
+            await self.app.store.job_queue.remember_source(
+                self.get_source_id(event.document), job.path
+            )
+            return await self.__edit(reply, self.DOC_DUPLICATE_MSG)
+        await self.__edit(reply, f"{self.DOC_ACCEPTED_MSG}\n{event.file.name}: in the upload queue")
+        task = asyncio.create_task(
+            self.__report_result(job, event.document, reply, download_time)
         )
-        return message
+        self._followups.add(task)
+        task.add_done_callback(self._followups.discard)
+
+    async def __report_result(self, job: Job, document, reply, download_time: float):
+        job = await self.app.store.job_queue.wait(job)
+        if job.state == JobState.DONE:
+            await self.app.store.job_queue.remember_source(
+                self.get_source_id(document), job.path
+            )
+            message = (
+                f"{self.DOC_SUCCESS_MSG}\n"
+                f"Download: {download_time:.1f} s, queue: {job.wait_time:.1f} s, "
+                f"upload: {job.upload_time:.1f} s"
+            )
+        else:
+            message = self.DOC_FAILED_MSG.format(error=job.error)
+        await self.__edit(reply, message)
+
+    async def __reply(self, event, message: str, file=None):
+        """Replies to the event through the outbound scheduler, the files go in the lower lane."""
+        priority = Priority.TEXT if file is None else Priority.FILE
+
+        async def send():
+            # The request is sent again after a flood wait, the file is read from the beginning.
+            if hasattr(file, "seek"):
+                file.seek(0)
+            return await event.reply(message, file=file)
+
+        return await self.scheduler.send(event.chat_id, send, priority)
+
+    async def __edit(self, reply, message: str):
+        try:
+            await self.scheduler.send(reply.chat_id, lambda: reply.edit(message))
+        except Exception as error:
+            self.logger.warning(f"Failed to edit the reply, {error}")
 
     # async def __empty(self):
     #     self.logger.warning("Command not found")
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import os
+from logging import Logger
+from typing import Awaitable, Callable, Optional
+
+MAX_RETRY_DELAY = 60
+
+
+class CommandRegistry:
+    """Synchronizes the command list of the bot with Telegram.
+
+    Bursts of updates are coalesced into one sync after `delay` seconds. The sync sends only
+    the languages whose command list differs from the last synced one, concurrently,
+    and the hashes of the synced lists are kept in the state file, so a restart with
+    the same commands does not send anything. The languages that failed to sync are retried
+    with a growing delay, up to MAX_RETRY_DELAY seconds.
+
+    Args:
+        send (Callable[[str, list[tuple[str, str]]], Awaitable]): A function that sets
+            the commands of the language in Telegram.
+        lang_codes (list[str]): The languages of the commands.
+        state_path (str): The path to the file of the last synced state.
+        delay (float): The time in seconds the updates are collected before the sync.
+        logger (Logger): The logger.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, list[tuple[str, str]]], Awaitable],
+        lang_codes: list[str],
+        state_path: str,
+        delay: float,
+        logger: Logger,
+    ):
+        self.send = send
+        self.lang_codes = lang_codes
+        self.state_path = state_path
+        self.delay = delay
+        self.logger = logger
+        self._commands: list[tuple[str, str]] = []
+        self._state: dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Reads the last synced state."""
+        self._state = await asyncio.to_thread(self._read_state)
+
+    def update(self, commands: list[tuple[str, str]]):
+        """Sets the desired commands and schedules the sync.
+
+        Args:
+            commands (list[tuple[str, str]]): The commands and their descriptions.
+        """
+        self._commands = list(commands)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.__sync_later())
+
+    async def close(self):
+        """Syncs the pending update at once, without waiting for the delay."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await self.__sync(self._commands)
+        except Exception as error:
+            self.logger.warning(f"Failed to sync the bot commands, {error}")
+
+    @staticmethod
+    def make_digest(commands: list[tuple[str, str]]) -> str:
+        """Returns the hash of the command list.
+
+        Args:
+            commands (list[tuple[str, str]]): The commands and their descriptions.
+
+        Returns:
+            str: The hash of the command list.
+        """
+        return hashlib.sha256(json.dumps(commands).encode()).hexdigest()
+
+    async def __sync_later(self):
+        delay = self.delay
+        while True:
+            await asyncio.sleep(delay)
+            commands = self._commands
+            synced = await self.__sync(commands)
+            if commands is not self._commands:
+                delay = self.delay
+            elif synced:
+                return
+            else:
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    async def __sync(self, commands: list[tuple[str, str]]) -> bool:
+        digest = self.make_digest(commands)
+        changed = [lang for lang in self.lang_codes if self._state.get(lang) != digest]
+        if not changed:
+            return True
+        results = await asyncio.gather(
+            *[self.send(lang, commands) for lang in changed], return_exceptions=True
+        )
+        failed = []
+        for lang, result in zip(changed, results):
+            if isinstance(result, Exception):
+                self.logger.warning(f"Failed to sync the bot commands ({lang}), {result}")
+                # The commands of the language in Telegram are unknown, so they are sent again.
+                self._state.pop(lang, None)
+                failed.append(lang)
+            else:
+                self._state[lang] = digest
+        await asyncio.to_thread(self._write_state)
+        self.logger.info(f"Bot commands synced: {len(commands)}, languages: {changed}, failed: {failed}")
+        return not failed
+
+    def _read_state(self) -> dict[str, str]:
+        try:
+            with open(self.state_path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_state(self):
+        with open(f"{self.state_path}.tmp", "w") as file:
+            json.dump(self._state, file)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
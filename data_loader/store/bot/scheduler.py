@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from logging import Logger
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from telethon.errors import FloodWaitError
+
+GLOBAL = None
+
+
+class Priority(IntEnum):
+    """The lane of the outbound request, the lower lanes go first."""
+
+    CONTROL = 0
+    TEXT = 1
+    FILE = 2
+
+
+class TokenBucket:
+    """Token bucket pacing the requests.
+
+    Args:
+        rate (float): The number of tokens added per second.
+        burst (int): Maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Returns the time in seconds until a token is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        delay = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(delay, self.blocked_until - now)
+
+    def take(self):
+        """Takes a token."""
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """Does not give tokens for the time of the flood wait."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+@dataclass(order=True)
+class Request:
+    """The outbound request waiting in the scheduler."""
+
+    priority: Priority
+    seq: int
+    chat_id: Optional[Hashable] = field(compare=False)
+    call: Callable[[], Awaitable] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    created_at: float = field(default_factory=time.monotonic, compare=False)
+
+
+class OutboundScheduler:
+    """Scheduler of the outbound requests of the bot.
+
+    Requests are paced by a global token bucket and by a token bucket of each chat,
+    the requests of the lower priority lanes are sent only when the higher lanes have
+    nothing ready to send. When Telegram answers with a flood wait, the chat (or the whole bot
+    for the requests without a chat) is paused for the given time and the request is rescheduled.
+    The short flood waits, up to `flood_sleep_threshold` of the client, are slept through by Telethon
+    inside the request, so the downloads and the other requests outside the scheduler keep retrying them.
+
+    Args:
+        global_rate (float): Maximum number of requests per second of the bot.
+        chat_rate (float): Maximum number of requests per second to one chat.
+        chat_burst (int): Number of requests to one chat sent without pacing.
+        logger (Logger): The logger.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, logger: Logger):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.logger = logger
+        self._global = TokenBucket(global_rate, max(int(global_rate), 1))
+        self._chats: dict[Hashable, TokenBucket] = {}
+        self._heap: list[Request] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._dispatched = 0
+        self._sent = 0
+        self._flood_waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self):
+        """Starts dispatching the requests."""
+        self._dispatcher = asyncio.create_task(self.__dispatch())
+
+    async def stop(self):
+        """Stops dispatching, the requests waiting in the scheduler are cancelled."""
+        tasks = [self._dispatcher, *self._tasks] if self._dispatcher else [*self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for request in self._heap:
+            request.future.cancel()
+        self._heap.clear()
+
+    async def send(
+        self,
+        chat_id: Optional[Hashable],
+        call: Callable[[], Awaitable],
+        priority: Priority = Priority.TEXT,
+    ) -> Any:
+        """Schedules the request and waits for its result.
+
+        Args:
+            chat_id (Hashable, optional): The chat the request is sent to, None for the requests
+                paced only globally.
+            call (Callable[[], Awaitable]): A function that sends the request.
+            priority (Priority, optional): The lane of the request. Defaults to Priority.TEXT.
+
+        Returns:
+            Any: The result of the request.
+
+        Raises:
+            RuntimeError: If the scheduler is stopped.
+        """
+        if self._dispatcher is None or self._dispatcher.done():
+            raise RuntimeError("The outbound scheduler is stopped")
+        future = asyncio.get_running_loop().create_future()
+        self.__push(Request(priority, next(self._seq), chat_id, call, future))
+        return await future
+
+    @property
+    def stats(self) -> dict:
+        """The queue depth of each lane, the number of sent requests and flood waits,
+        and the average and maximum time in seconds the requests waited in the queue."""
+        return {
+            "queued": {
+                priority.name.lower(): sum(r.priority == priority for r in self._heap)
+                for priority in Priority
+            },
+            "in_flight": len(self._tasks),
+            "sent": self._sent,
+            "flood_waits": self._flood_waits,
+            "wait_avg": self._wait_total / self._dispatched if self._dispatched else 0.0,
+            "wait_max": self._wait_max,
+        }
+
+    def __push(self, request: Request):
+        heapq.heappush(self._heap, request)
+        self._wakeup.set()
+
+    def __bucket(self, chat_id: Optional[Hashable]) -> TokenBucket:
+        if chat_id is GLOBAL:
+            return self._global
+        if (bucket := self._chats.get(chat_id)) is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def __dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self.__dispatch_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def __dispatch_ready(self) -> Optional[float]:
+        now = time.monotonic()
+        delay, skipped = None, []
+        while self._heap:
+            request = heapq.heappop(self._heap)
+            if request.future.done():
+                continue
+            if (wait := self._global.delay(now)) > 0:
+                skipped.append(request)
+                delay = wait if delay is None else min(delay, wait)
+                break
+            if (wait := self.__bucket(request.chat_id).delay(now)) > 0:
+                skipped.append(request)
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            self._global.take()
+            if request.chat_id is not GLOBAL:
+                self.__bucket(request.chat_id).take()
+            wait = now - request.created_at
+            self._dispatched += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            task = asyncio.create_task(self.__run(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        for request in skipped:
+            heapq.heappush(self._heap, request)
+        return delay
+
+    async def __run(self, request: Request):
+        try:
+            result = await request.call()
+        except FloodWaitError as error:
+            self._flood_waits += 1
+            self.__bucket(request.chat_id).block(error.seconds)
+            self.logger.warning(
+                f"Flood wait {error.seconds} s, chat {request.chat_id}, request rescheduled"
+            )
+            self.__push(request)
+        except Exception as error:
+            if not request.future.done():
+                request.future.set_exception(error)
+        else:
+            self._sent += 1
+            if not request.future.done():
+                request.future.set_result(result)
@@ -1,13 +1,12 @@
 from urllib.parse import urljoin
 
 from aiohttp import ClientSession
-from core.settings import ServiceSettings
-
-BASE_URL = ServiceSettings().clicker_base_url
+from core.settings import ServiceSettings, get_settings
 
 
 async def create_request_url(relative_url: str, **parameters):
-    url = urljoin(BASE_URL, relative_url.format(**parameters))
+    base_url = get_settings(ServiceSettings).clicker_base_url
+    url = urljoin(base_url, relative_url.format(**parameters))
     return url
 
 
@@ -0,0 +1,56 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from base.base_accessor import BaseAccessor
+from core.settings import HttpClientSettings, get_settings
+
+
+class HttpClientAccessor(BaseAccessor):
+    """The shared HTTP client of the application.
+
+    Owns the pool of keep-alive connections, which is used by all outbound HTTP requests,
+    so the requests do not pay for a new TCP connection and DNS lookup each time.
+    """
+
+    settings: HttpClientSettings
+    connector: TCPConnector = None
+    timeout: ClientTimeout
+    session: ClientSession = None
+
+    async def connect(self):
+        """Creates the connection pool and the shared session."""
+        self.settings = get_settings(HttpClientSettings)
+        self.connector = TCPConnector(
+            limit=self.settings.http_limit,
+            limit_per_host=self.settings.http_limit_per_host,
+            keepalive_timeout=self.settings.http_keepalive_timeout,
+            ttl_dns_cache=self.settings.http_dns_ttl,
+        )
+        self.timeout = ClientTimeout(
+            total=None,
+            connect=self.settings.http_connect_timeout,
+            sock_read=self.settings.http_read_timeout,
+        )
+        self.session = self.make_session()
+        self.logger.info("HTTP client connected")
+
+    async def disconnect(self):
+        """Closes the shared session and all pooled connections."""
+        if self.session is not None:
+            await self.session.close()
+        if self.connector is not None:
+            await self.connector.close()
+        self.logger.info("HTTP client disconnected")
+
+    def make_session(self, **kwargs) -> ClientSession:
+        """Creates a session that uses the shared connection pool.
+
+        The session does not own the pool, so closing it leaves the pooled connections open.
+
+        Args:
+            **kwargs: Arbitrary keyword arguments of `aiohttp.ClientSession`.
+
+        Returns:
+            ClientSession: The new session.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return ClientSession(connector=self.connector, connector_owner=False, **kwargs)
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import AsyncIterator, Callable, Optional
+
+from base.base_accessor import BaseAccessor
+from core.settings import FileSettings, JobQueueSettings, get_settings
+from store.job_queue.exception import JobQueueFullException
+from store.job_queue.index import PersistentIndex
+from store.job_queue.job import Job, JobState
+from store.job_queue.manifest import JobManifest
+from store.job_queue.pipeline import make_pipeline
+
+MANIFEST_NAME = "manifest.sqlite3"
+HASH_INDEX_TABLE = "hash_index"
+SOURCE_INDEX_TABLE = "source_index"
+SPOOL_SUFFIX = ".spool"
+ORPHAN_AGE = 3600
+TRIM_INTERVAL = 60
+
+
+class JobQueueAccessor(BaseAccessor):
+    """Background queue of jobs uploading files to the cloud.
+
+    Accepted files are written to the local spool directory and recorded in the manifest,
+    and a bounded pool of workers uploads them to Yandex Disk, so the caller does not wait for the cloud.
+    Failed uploads are retried, and the jobs that were not uploaded are replayed at startup.
+    A file whose content has already been uploaded is not uploaded again,
+    and a file whose source is remembered is not even transferred.
+
+    Several processes can share the spool: the producers only accept the files,
+    and the only consumer uploads them, picking up the jobs of the producers from the manifest.
+    The producers do not connect to the cloud, so the duplicates they accept are found by the consumer.
+
+    Args:
+        app (Application): The application.
+        consumer (bool, optional): Whether this process uploads the files. Defaults to True.
+    """
+
+    dependencies = ("YaDiskAccessor",)
+    settings: JobQueueSettings
+    file_settings: FileSettings
+    manifest: JobManifest
+    hash_index: PersistentIndex
+    source_index: PersistentIndex
+    _queue: asyncio.Queue
+    _jobs: OrderedDict[str, Job]
+    _workers: list[asyncio.Task]
+    _retries: set[asyncio.TimerHandle]
+    _finished: dict[str, asyncio.Event]
+    _poller: Optional[asyncio.Task]
+
+    def __init__(self, app, consumer: bool = True):
+        self.consumer = consumer
+        super().__init__(app)
+
+    def _init(self):
+        self.manifest = None
+        self.hash_index = None
+        self.source_index = None
+        self._retries = set()
+        self._workers = []
+        self._poller = None
+
+    async def connect(self):
+        """Opens the spool and, in the consumer, replays the unfinished jobs and starts the upload workers."""
+        self.settings = get_settings(JobQueueSettings)
+        self.file_settings = get_settings(FileSettings)
+        os.makedirs(self.settings.job_spool_dir, exist_ok=True)
+        manifest_path = os.path.join(self.settings.job_spool_dir, MANIFEST_NAME)
+        self.manifest = JobManifest(manifest_path)
+        self.hash_index = PersistentIndex(
+            manifest_path, HASH_INDEX_TABLE, self.settings.job_hash_index_size
+        )
+        self.source_index = PersistentIndex(
+            manifest_path, SOURCE_INDEX_TABLE, self.settings.job_source_index_size
+        )
+        self._jobs = OrderedDict()
+        self._queue = asyncio.Queue()
+        self._retries = set()
+        self._finished = {}
+        self._workers = []
+        self._poller = None
+        if not self.consumer:
+            self.logger.info("Job queue connected, producer")
+            return
+        await self.__replay()
+        self._workers = [
+            asyncio.create_task(self.__worker())
+            for _ in range(self.settings.job_workers)
+        ]
+        self._poller = asyncio.create_task(self.__poll())
+        self.logger.info(f"Job queue connected, workers: {self.settings.job_workers}")
+
+    async def disconnect(self):
+        """Stops the upload workers, the unfinished jobs stay in the spool."""
+        for handle in self._retries:
+            handle.cancel()
+        tasks = [*self._workers, self._poller] if self._poller else self._workers
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for store in (self.manifest, self.hash_index, self.source_index):
+            if store is not None:
+                store.close()
+        self.logger.info("Job queue disconnected")
+
+    async def put(
+        self, iter_file: Callable[[], AsyncIterator[bytes]], file_name: str
+    ) -> Job:
+        """Writes the file to the spool and adds the upload job to the queue.
+
+        The file is read ahead while the spool is being written.
+        The job is recorded in the manifest before it is returned,
+        so it will be uploaded even if the application is restarted.
+        If a file with the same content has already been uploaded, the job is finished at once
+        and refers to the existing file in the cloud, in a producer it is found later by the consumer.
+
+        Args:
+            iter_file (Callable[[], AsyncIterator[bytes]]): A function that returns an asynchronous
+            iterator of bytes of the file.
+            file_name (str): The name of the file.
+
+        Returns:
+            Job: The accepted job.
+
+        Raises:
+            JobQueueFullException: If there are too many jobs waiting for upload.
+        """
+        pending_count = (
+            self.pending_count if self.consumer else await self.manifest.count_unfinished()
+        )
+        if pending_count >= self.settings.job_queue_size:
+            raise JobQueueFullException()
+        job = Job(file_name, "")
+        job.spool_path = os.path.join(
+            self.settings.job_spool_dir, f"{job.id}{SPOOL_SUFFIX}"
+        )
+        sha256 = hashlib.sha256()
+
+        def write(chunk: bytes):
+            file.write(chunk)
+            sha256.update(chunk)
+
+        try:
+            with open(job.spool_path, "wb") as file:
+                async for chunk in self.make_pipeline(iter_file)():
+                    await asyncio.to_thread(write, chunk)
+                    job.size += len(chunk)
+                await asyncio.to_thread(file.flush)
+                await asyncio.to_thread(os.fsync, file.fileno())
+            job.sha256 = sha256.hexdigest()
+            if self.consumer and (path := await self.__find_path(self.hash_index, job.sha256)):
+                os.remove(job.spool_path)
+                job.state = JobState.DONE
+                job.duplicate = True
+                job.path = path
+                job.finished_at = time.time()
+            if self.consumer:
+                self.__add_job(job)
+            await self.manifest.save(job)
+        except BaseException:
+            self._jobs.pop(job.id, None)
+            if os.path.exists(job.spool_path):
+                os.remove(job.spool_path)
+            raise
+        if job.duplicate:
+            self.logger.info(f"Job {job.id}: file {job.file_name} is a duplicate of {job.path}")
+        if self.consumer and not job.duplicate:
+            self._queue.put_nowait(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Returns the job by its ID.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            Optional[Job]: The job, or None if it is unknown.
+        """
+        if job := self._jobs.get(job_id):
+            return job
+        return await self.manifest.get(job_id)
+
+    async def find_source(self, source_id: str) -> Optional[str]:
+        """Returns the path in the cloud of the file that was uploaded from the source.
+
+        Args:
+            source_id (str): The stable ID of the file in its source, e.g. the Telegram document ID.
+
+        Returns:
+            Optional[str]: The path of the file in the cloud, or None if the source is unknown
+            or the file is no longer in the cloud.
+        """
+        return await self.__find_path(self.source_index, source_id)
+
+    async def remember_source(self, source_id: str, path: str):
+        """Remembers that the file from the source is uploaded to the path in the cloud.
+
+        Args:
+            source_id (str): The stable ID of the file in its source.
+            path (str): The path of the file in the cloud.
+        """
+        await self.source_index.set(source_id, path)
+
+    async def wait(self, job: Job) -> Job:
+        """Waits until the job is finished, successfully or not.
+
+        Args:
+            job (Job): The job returned by `put`.
+
+        Returns:
+            Job: The finished job.
+        """
+        if not job.is_finished:
+            await self._finished.setdefault(job.id, asyncio.Event()).wait()
+        return job
+
+    @property
+    def pending_count(self) -> int:
+        """The number of jobs waiting for upload, including the jobs waiting for a retry."""
+        return sum(not job.is_finished for job in self._jobs.values())
+
+    def make_async_iterator(self, job: Job) -> Callable[[], AsyncIterator[bytes]]:
+        """Creates an asynchronous iterator that reads the spooled file of the job.
+
+        The spooled file is read ahead while the previous chunks are being uploaded.
+
+        Parameters:
+            job (Job): The upload job.
+
+        Returns:
+            Callable[[], AsyncIterator[bytes]]: A function that returns an asynchronous
+            iterator of bytes of the file, counting the bytes sent.
+        """
+
+        async def iter_spool():
+            chunk_size = self.file_settings.chunk_size
+            with open(job.spool_path, "rb") as file:
+                while chunk := await asyncio.to_thread(file.read, chunk_size):
+                    yield chunk
+
+        async def iter_upload():
+            job.bytes_sent = 0
+            async for chunk in self.make_pipeline(iter_spool)():
+                yield chunk
+                job.bytes_sent += len(chunk)
+
+        return iter_upload
+
+    def make_pipeline(
+        self, iter_file: Callable[[], AsyncIterator[bytes]]
+    ) -> Callable[[], AsyncIterator[bytes]]:
+        """Wraps the asynchronous iterator of a file into a transfer pipeline with a bounded read-ahead.
+
+        Parameters:
+            iter_file (Callable[[], AsyncIterator[bytes]]): A function that returns an asynchronous
+            iterator of bytes of the file.
+
+        Returns:
+            Callable[[], AsyncIterator[bytes]]: A function that returns an asynchronous
+            iterator of bytes of the file.
+        """
+        return make_pipeline(
+            iter_file,
+            self.file_settings.prefetch_count,
+            self.file_settings.min_chunk_size,
+            self.file_settings.max_chunk_size,
+        )
+
+    async def __find_path(self, index: PersistentIndex, key: str) -> Optional[str]:
+        if not (path := await index.get(key)):
+            return None
+        try:
+            if await self.app.store.ya_disk.exists(path):
+                return path
+        except Exception as error:
+            self.logger.warning(f"Failed to check the duplicate {path}, {error}")
+            return None
+        await index.delete(key)
+
+    async def __replay(self):
+        jobs = await self.manifest.get_unfinished()
+        for job in jobs:
+            if not os.path.exists(job.spool_path):
+                job.state = JobState.FAILED
+                job.error = "The spooled file is lost"
+                await self.manifest.save(job)
+                continue
+            job.state = JobState.QUEUED
+            self.__add_job(job)
+            self._queue.put_nowait(job)
+        self.__remove_orphans()
+        await self.manifest.trim(self.settings.job_history_size)
+        if jobs:
+            self.logger.info(f"Job queue: {self._queue.qsize()} unfinished jobs replayed")
+
+    async def __poll(self):
+        """Picks up the jobs accepted by other processes, and trims the manifest every TRIM_INTERVAL seconds."""
+        interval = self.settings.job_poll_interval or TRIM_INTERVAL
+        trimmed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.settings.job_poll_interval:
+                    await self.__pick_up()
+                if time.monotonic() - trimmed_at >= TRIM_INTERVAL:
+                    trimmed_at = time.monotonic()
+                    await self.manifest.trim(self.settings.job_history_size)
+            except Exception as error:
+                self.logger.warning(f"Failed to poll the manifest, {error}")
+
+    async def __pick_up(self):
+        for job in await self.manifest.get_unfinished():
+            if job.state == JobState.QUEUED and job.id not in self._jobs:
+                self.__add_job(job)
+                self._queue.put_nowait(job)
+
+    def __remove_orphans(self):
+        spooled = {job.spool_path for job in self._jobs.values()}
+        for name in os.listdir(self.settings.job_spool_dir):
+            path = os.path.join(self.settings.job_spool_dir, name)
+            if (
+                name.endswith(SPOOL_SUFFIX)
+                and path not in spooled
+                and time.time() - os.path.getmtime(path) > ORPHAN_AGE
+            ):
+                os.remove(path)
+
+    async def __worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.__run(job)
+            except Exception as error:
+                self.logger.error(f"Job {job.id}: file {job.file_name} was not processed, {error!r}")
+            finally:
+                self._queue.task_done()
+
+    async def __run(self, job: Job):
+        job.state = JobState.RUNNING
+        job.started_at = time.time()
+        job.attempts += 1
+        await self.manifest.save(job)
+        try:
+            if path := await self.__find_path(self.hash_index, job.sha256):
+                job.duplicate = True
+                job.path = path
+                self.logger.info(f"Job {job.id}: file {job.file_name} is a duplicate of {job.path}")
+            else:
+                job.path = await self.app.store.ya_disk.upload_file(
+                    self.make_async_iterator(job), job.file_name
+                )
+                await self.hash_index.set(job.sha256, job.path)
+                self.logger.info(f"Job {job.id}: file {job.file_name} uploaded to {job.path}")
+            job.state = JobState.DONE
+            job.error = None
+        except Exception as error:
+            job.error = str(error)
+            if job.attempts < self.settings.job_retry_count:
+                self.__retry(job)
+                await self.manifest.save(job)
+                return
+            job.state = JobState.FAILED
+            self.logger.error(f"Job {job.id}: file {job.file_name} failed, {error}")
+        job.finished_at = time.time()
+        try:
+            await self.manifest.save(job)
+            with suppress(FileNotFoundError):
+                os.remove(job.spool_path)
+            if job.state == JobState.DONE:
+                await self.__invalidate_reports()
+        finally:
+            if event := self._finished.pop(job.id, None):
+                event.set()
+
+    async def __invalidate_reports(self):
+        # The report service exists only in the process that runs the bot.
+        if not (tg_report := getattr(self.app.store, "tg_report", None)):
+            return
+        try:
+            await tg_report.invalidate()
+        except Exception as error:
+            self.logger.warning(f"Failed to invalidate the cached reports, {error}")
+
+    def __retry(self, job: Job):
+        job.state = JobState.QUEUED
+        delay = min(
+            self.settings.job_retry_delay * 2 ** (job.attempts - 1),
+            self.settings.job_retry_max_delay,
+        )
+        self.logger.warning(
+            f"Job {job.id}: attempt {job.attempts} failed, {job.error}, retry in {delay} s"
+        )
+
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    def __add_job(self, job: Job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.settings.job_history_size:
+            oldest = next(iter(self._jobs.values()))
+            if not oldest.is_finished:
+                break
+            self._jobs.popitem(last=False)
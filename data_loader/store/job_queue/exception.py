@@ -0,0 +1,9 @@
+from base.base_exception import ExceptionBase
+
+
+class JobQueueException(ExceptionBase):
+    args = ("Unknown error",)
+
+
+class JobQueueFullException(JobQueueException):
+    args = ("The upload queue is full, please try again later.",)
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class PersistentIndex:
+    """A persistent key-value index stored in SQLite.
+
+    When the index grows beyond `max_size`, the least recently used keys are evicted.
+
+    Args:
+        path (str): The path to the SQLite database file.
+        table (str): The name of the table of the index.
+        max_size (int): Maximum number of keys in the index.
+    """
+
+    def __init__(self, path: str, table: str, max_size: int):
+        self.table = table
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            f"(key TEXT PRIMARY KEY, value TEXT, used_at REAL)"
+        )
+        self._connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_used_at ON {table} (used_at)"
+        )
+        self._connection.commit()
+
+    def close(self):
+        """Closes the connection to the database."""
+        with self._lock:
+            self._connection.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Returns the value of the key and marks the key as recently used.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            Optional[str]: The value, or None if the key is not in the index.
+        """
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str):
+        """Sets the value of the key, evicting the least recently used keys if necessary.
+
+        Args:
+            key (str): The key.
+            value (str): The value.
+        """
+        await asyncio.to_thread(self._set, key, value)
+
+    async def delete(self, key: str):
+        """Deletes the key from the index.
+
+        Args:
+            key (str): The key.
+        """
+        await asyncio.to_thread(self._execute, f"DELETE FROM {self.table} WHERE key = ?", key)
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._connection.execute(
+                    f"UPDATE {self.table} SET used_at = ? WHERE key = ?", (time.time(), key)
+                )
+                self._connection.commit()
+            return row[0] if row else None
+
+    def _set(self, key: str, value: str):
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, used_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                f"ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            self._connection.commit()
+
+    def _execute(self, query: str, *parameters):
+        with self._lock:
+            self._connection.execute(query, parameters)
+            self._connection.commit()
@@ -0,0 +1,70 @@
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+from uuid import uuid4
+
+
+class JobState(str, Enum):
+    """The state of the upload job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """The job of uploading a file to the cloud.
+
+    Attributes:
+        file_name (str): The name of the uploaded file.
+        spool_path (str): The local path where the file waits for upload.
+        id (str): The job ID.
+        state (JobState): The state of the job.
+        size (int): The size of the file in bytes.
+        bytes_sent (int): The number of bytes sent to the cloud.
+        attempts (int): The number of upload attempts made.
+        sha256 (str, optional): The SHA-256 hash of the file content.
+        duplicate (bool): Whether the same file has already been uploaded.
+        path (str, optional): The path of the file in the cloud.
+        error (str, optional): The error message if the job failed.
+        created_at (float): The time the job was accepted.
+        started_at (float, optional): The time the upload started.
+        finished_at (float, optional): The time the upload finished.
+    """
+
+    file_name: str
+    spool_path: str
+    id: str = field(default_factory=lambda: uuid4().hex)
+    state: JobState = JobState.QUEUED
+    size: int = 0
+    bytes_sent: int = 0
+    attempts: int = 0
+    sha256: Optional[str] = None
+    duplicate: bool = False
+    path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether the job is finished, successfully or not."""
+        return self.state in (JobState.DONE, JobState.FAILED)
+
+    @property
+    def wait_time(self) -> Optional[float]:
+        """The time in seconds that the job waited in the queue."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.created_at
+
+    @property
+    def upload_time(self) -> Optional[float]:
+        """The time in seconds spent uploading the file to the cloud."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
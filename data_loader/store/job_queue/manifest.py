@@ -0,0 +1,123 @@
+import asyncio
+import sqlite3
+import threading
+from dataclasses import astuple, fields
+from typing import Optional
+
+from store.job_queue.job import Job, JobState
+
+COLUMNS = [field.name for field in fields(Job)]
+SAVE_QUERY = (
+    f"INSERT OR REPLACE INTO jobs ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+
+class JobManifest:
+    """The SQLite manifest of the upload jobs.
+
+    Every accepted job is written to the manifest before the caller gets an answer,
+    so the jobs that were not uploaded can be replayed after a restart.
+
+    Args:
+        path (str): The path to the SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS jobs ({', '.join(COLUMNS)}, PRIMARY KEY (id))"
+        )
+        self.__migrate()
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)"
+        )
+        self._connection.commit()
+
+    def close(self):
+        """Closes the connection to the database."""
+        with self._lock:
+            self._connection.close()
+
+    async def save(self, job: Job):
+        """Inserts or updates the job.
+
+        Args:
+            job (Job): The upload job.
+        """
+        await asyncio.to_thread(self._execute, SAVE_QUERY, astuple(job))
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Returns the job by its ID.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            Optional[Job]: The job, or None if it is unknown.
+        """
+        rows = await asyncio.to_thread(
+            self._execute, f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        )
+        return self.__make_job(rows[0]) if rows else None
+
+    async def get_unfinished(self) -> list[Job]:
+        """Returns the jobs that were not uploaded, in the order they were accepted.
+
+        Returns:
+            list[Job]: The unfinished jobs.
+        """
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE state IN (?, ?) ORDER BY created_at",
+            (JobState.QUEUED.value, JobState.RUNNING.value),
+        )
+        return [self.__make_job(row) for row in rows]
+
+    async def count_unfinished(self) -> int:
+        """Returns the number of jobs that were not uploaded.
+
+        Returns:
+            int: The number of unfinished jobs.
+        """
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)",
+            (JobState.QUEUED.value, JobState.RUNNING.value),
+        )
+        return rows[0][0]
+
+    async def trim(self, history_size: int):
+        """Deletes the oldest finished jobs, keeping no more than `history_size` of them.
+
+        Args:
+            history_size (int): The number of finished jobs to keep.
+        """
+        await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM jobs WHERE state IN (?, ?) AND id NOT IN "
+            "(SELECT id FROM jobs WHERE state IN (?, ?) ORDER BY created_at DESC LIMIT ?)",
+            (JobState.DONE.value, JobState.FAILED.value) * 2 + (history_size,),
+        )
+
+    def _execute(self, query: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+            self._connection.commit()
+            return rows
+
+    def __migrate(self):
+        """Adds the columns of the job fields that are missing in a manifest created by an older version."""
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        for column in COLUMNS:
+            if column not in existing:
+                self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+
+    @staticmethod
+    def __make_job(row: tuple) -> Job:
+        job = Job(**dict(zip(COLUMNS, row)))
+        job.state = JobState(job.state)
+        job.duplicate = bool(job.duplicate)
+        return job
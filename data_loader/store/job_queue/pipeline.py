@@ -0,0 +1,70 @@
+import asyncio
+import time
+from typing import AsyncIterator, Callable
+
+CHUNK_INTERVAL = 0.25
+
+
+def make_pipeline(
+    iter_file: Callable[[], AsyncIterator[bytes]],
+    prefetch_count: int,
+    min_chunk_size: int,
+    max_chunk_size: int,
+) -> Callable[[], AsyncIterator[bytes]]:
+    """Wraps the asynchronous iterator of a file into a transfer pipeline.
+
+    The source is read by a background task into a bounded queue of prefetched chunks,
+    so the source and the consumer work at the same time, and the transfer takes about
+    as long as the slower of them. When the queue is full, the source is not read
+    until the consumer takes a chunk, so at most `prefetch_count` chunks are kept in memory.
+    The chunks of the source are regrouped into chunks of the size that the source
+    produces in about `CHUNK_INTERVAL` seconds, between `min_chunk_size` and `max_chunk_size`.
+
+    Args:
+        iter_file (Callable[[], AsyncIterator[bytes]]): A function that returns an asynchronous
+            iterator of bytes of the file.
+        prefetch_count (int): Maximum number of prefetched chunks.
+        min_chunk_size (int): Minimum size of the chunk, in bytes.
+        max_chunk_size (int): Maximum size of the chunk, in bytes.
+
+    Returns:
+        Callable[[], AsyncIterator[bytes]]: A function that returns an asynchronous
+        iterator of bytes of the file.
+    """
+
+    async def produce(queue: asyncio.Queue):
+        chunk_size = min_chunk_size
+        buffer = bytearray()
+        started_at = time.monotonic()
+        try:
+            async for chunk in iter_file():
+                buffer += chunk
+                if len(buffer) < chunk_size:
+                    continue
+                elapsed = time.monotonic() - started_at
+                throughput = len(buffer) / elapsed if elapsed else max_chunk_size
+                chunk_size = min(
+                    max(int(throughput * CHUNK_INTERVAL), min_chunk_size), max_chunk_size
+                )
+                await queue.put(bytes(buffer))
+                buffer.clear()
+                started_at = time.monotonic()
+            if buffer:
+                await queue.put(bytes(buffer))
+            await queue.put(None)
+        except Exception as error:
+            await queue.put(error)
+
+    async def iter_pipeline():
+        queue = asyncio.Queue(maxsize=max(prefetch_count, 1))
+        producer = asyncio.create_task(produce(queue))
+        try:
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    return iter_pipeline
@@ -1,69 +1,186 @@
+import asyncio
+import os
+import time
 from datetime import datetime, timedelta
-from io import BytesIO
-from typing import Coroutine, Callable
+from functools import partial
+from typing import BinaryIO, Coroutine, Callable, Optional
 from urllib.parse import urljoin
 
-from aiohttp import ClientSession
 from icecream import ic
 
 from base.base_accessor import BaseAccessor
-from core.settings import ServiceSettings
-from store.report_service.time_utils import get_week_number, get_start_end_of_week, get_first_and_last_day_of_month, \
-    get_first_day_of_month
+from core.settings import ReportCacheSettings, ServiceSettings, get_settings
+from store.report_service.cache import ReportCache, ReportFile
+from store.report_service.composer import merge_reports
+from store.report_service.time_utils import get_first_and_last_day_of_month, get_days, get_last_days, get_last_month, \
+    get_week
 
 
 class TGReportService(BaseAccessor):
     CLEAR_DATABASE_URL = "/analysis/clear_db/"
     ANALYSIS_REPORT_URL = "/analysis/report/?start_date={start_date}&end_date={end_date}&kip_empty=true"
+    DOWNLOAD_CHUNK_SIZE = 1024 * 256
+    dependencies = ("HttpClientAccessor", "TgBotAccessor")
     bot_report_commands: list[tuple[str, str, Callable[[], Coroutine]]] = None
     settings: ServiceSettings = None
+    cache_settings: ReportCacheSettings = None
+    cache: ReportCache = None
+    day_cache: ReportCache = None
+    _refresh_event: asyncio.Event = None
+    _refresh_task: asyncio.Task = None
 
     async def connect(self):
-        self.settings = ServiceSettings()
+        self.settings = get_settings(ServiceSettings)
+        self.cache_settings = get_settings(ReportCacheSettings)
+        cache_dir = self.cache_settings.report_cache_dir
+        self.cache = ReportCache(
+            self.cache_settings.report_cache_ttl,
+            self.cache_settings.report_cache_size,
+            self.cache_settings.report_spool_size,
+            cache_dir,
+        )
+        self.day_cache = ReportCache(
+            self.cache_settings.report_day_ttl,
+            self.cache_settings.report_day_cache_size,
+            self.cache_settings.report_spool_size,
+            os.path.join(cache_dir, "days") if cache_dir else None,
+        )
         self.bot_report_commands = self.create_report_commands()
         await self.app.bot.add_commands(self.bot_report_commands)
+        if self.cache_settings.report_refresh_interval:
+            self._refresh_event = asyncio.Event()
+            self._refresh_task = asyncio.create_task(self.__refresh_loop())
         self.logger.info("Telegram Report Service connected")
 
     async def disconnect(self):
-        await self.app.bot.remove_commands(self.bot_report_commands)
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        if self.bot_report_commands:
+            await self.app.bot.remove_commands(self.bot_report_commands)
         self.logger.info("Telegram Report Service disconnected")
 
     def create_request_url(self, relative_url: str, **parameters) -> str:
         url = urljoin(self.settings.base_url, relative_url.format(**parameters))
         return url
 
-    @staticmethod
-    async def make_request(url: str) -> bytes:
-        async with ClientSession() as session, session.get(url) as response:
+    async def make_request(self, url: str) -> bytes:
+        async with self.app.http.session.get(url) as response:
             return await response.read()
 
+    async def download_report(self, url: str) -> ReportFile:
+        """
+        Asynchronously downloads the report chunk by chunk into a spooled temporary file,
+        which is moved to disk when it grows beyond `report_spool_size`.
+
+        Args:
+            url (str): The URL of the report.
+
+        Returns:
+            ReportFile: The file of the report.
+        """
+        file = ReportFile(max_size=self.cache_settings.report_spool_size)
+        try:
+            async with self.app.http.session.get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
     async def clear_database(self):
         """
         Asynchronously clears the database by sending a request to the specified URL and returning the response.
         """
         url = self.create_request_url(self.CLEAR_DATABASE_URL)
         response = await self.make_request(url)
+        await self.invalidate()
+        await self.day_cache.clear()
         return response
 
-    async def get_report_by_date(self, start_date: str, end_date: str) -> BytesIO:
+    async def invalidate(self):
+        """
+        Asynchronously drops the cached reports, called when the data of the reports has changed.
+        Only the reports for the last `report_recent_days` days are affected by an upload, so the reports
+        for the earlier days are kept, a back-dated upload shows in them after `report_day_ttl`.
+        """
+        await self.cache.clear()
+        if self._refresh_event:
+            self._refresh_event.set()
+
+    async def get_report_by_date(
+            self, start_date: str, end_date: str, refresh: bool = False, ttl: Optional[float] = None
+    ) -> BinaryIO:
         """
         Asynchronously retrieves a report for a given date range.
+        The report is taken from the cache if it has been requested recently.
 
         Args:
             start_date (str): The start date of the report.
             end_date (str): The end date of the report.
+            refresh (bool, optional): Whether to request the report even if it is cached. Defaults to False.
+            ttl (float, optional): How long the report is cached. Defaults to the TTL of the cache.
 
         Returns:
-            BytesIO: A stream containing the report data.
+            BinaryIO: A stream containing the report data.
         """
-        url = self.create_request_url(self.ANALYSIS_REPORT_URL, start_date=start_date, end_date=end_date)
-        response = await self.make_request(url)
-        return BytesIO(response)
+        if self.cache_settings.report_incremental and start_date != end_date:
+            fetch = partial(self.compose_report, start_date, end_date)
+        else:
+            url = self.create_request_url(self.ANALYSIS_REPORT_URL, start_date=start_date, end_date=end_date)
+            fetch = partial(self.download_report, url)
+        return await self.cache.get_or_fetch((start_date, end_date), fetch, refresh, ttl)
+
+    async def compose_report(self, start_date: str, end_date: str) -> ReportFile:
+        """
+        Asynchronously composes a report for a given date range from the reports for each day.
+        Only the days that are not cached are requested from the analysis service.
+
+        Args:
+            start_date (str): The start date of the report.
+            end_date (str): The end date of the report.
+
+        Returns:
+            ReportFile: The file of the report.
+        """
+        reports = await asyncio.gather(
+            *[self.get_report_by_day(day) for day in get_days(start_date, end_date)], return_exceptions=True
+        )
+        if errors := [report for report in reports if isinstance(report, BaseException)]:
+            for report in reports:
+                if not isinstance(report, BaseException):
+                    report.close()
+            raise errors[0]
+        try:
+            return await asyncio.to_thread(merge_reports, reports, self.cache_settings.report_spool_size)
+        finally:
+            for report in reports:
+                report.close()
+
+    async def get_report_by_day(self, day: str) -> BinaryIO:
+        """
+        Asynchronously retrieves a report for one day.
+
+        The reports for the last `report_recent_days` days may still change, so they are
+        cached as usual reports, and the reports for the earlier days are cached for `report_day_ttl`.
 
-    async def get_report(self, start_date: str, end_date: str, name: str) -> BytesIO:
+        Args:
+            day (str): The day of the report.
+
+        Returns:
+            BinaryIO: The file of the report.
+        """
+        url = self.create_request_url(self.ANALYSIS_REPORT_URL, start_date=day, end_date=day)
+        recent = (datetime.now() - timedelta(self.cache_settings.report_recent_days)).strftime("%Y-%m-%d")
+        cache = self.cache if day > recent else self.day_cache
+        return await cache.get_or_fetch((day, day), partial(self.download_report, url))
+
+    async def get_report(self, start_date: str, end_date: str, name: str) -> BinaryIO:
         """
         Async function to get a report within a specific date range and assign a name to the report file.
-        Takes in start_date (str), end_date (str), and name (str) as parameters and returns a BytesIO object.
+        Takes in start_date (str), end_date (str), and name (str) as parameters and returns a file object.
 
         Args:
             start_date (str): The start date of the report.
@@ -71,110 +188,157 @@ class TGReportService(BaseAccessor):
             name (str): The name of the report.
 
         Returns:
-            BytesIO: A stream containing the report data.
+            BinaryIO: A stream containing the report data.
         """
         file = await self.get_report_by_date(start_date, end_date)
         file.name = name
         return file
 
-    async def get_report_week(self) -> BytesIO:
+    async def get_report_week(self) -> BinaryIO:
         """
-        Asynchronous function that retrieves a report for the past week and returns it as a BytesIO object.
+        Asynchronous function that retrieves a report for the past week and returns it as a file object.
         No parameters are accepted.
 
         Returns:
-             BytesIO: A BytesIO object containing the report.
+             BinaryIO: A file object containing the report.
         """
-        today = datetime.now()
-        start = (today - timedelta(6)).strftime("%Y-%m-%d")
-        end = today.strftime("%Y-%m-%d")
-
+        start, end = get_last_days(7, self.today())
         return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-    async def get_report_month(self) -> BytesIO:
+    async def get_report_month(self) -> BinaryIO:
         """
         Asynchronous function to get the report for the current month.
-        It returns a BytesIO object.
+        It returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
-        today = datetime.now()
-        start = (today - timedelta(29)).strftime("%Y-%m-%d")
-        end = today.strftime("%Y-%m-%d")
-
+        start, end = get_last_days(30, self.today())
         return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-    async def get_report_current_day(self) -> BytesIO:
+    async def get_report_current_day(self) -> BinaryIO:
         """
         Asynchronously gets the report for the current day.
-        Returns a BytesIO object.
+        Returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
-        start = datetime.now().strftime("%Y-%m-%d")
+        start = self.today()
         return await self.get_report(start, start, f"report_from {start}.xlsx")
 
-    async def get_report_current_week(self) -> BytesIO:
+    async def get_report_current_week(self) -> BinaryIO:
         """
         Asynchronously gets the report for the current week.
-        Returns a BytesIO object.
+        Returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
-        year = datetime.now().year
-        week_number = get_week_number()
-        start, end = get_start_end_of_week(year, week_number)
-
+        start, end = get_week(self.today())
         return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-    async def get_report_current_month(self) -> BytesIO:
+    async def get_report_current_month(self) -> BinaryIO:
         """
         Asynchronously gets the report for the current month.
-        Returns a BytesIO object.
+        Returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
-        start, end = get_first_and_last_day_of_month()
+        start, end = get_first_and_last_day_of_month(self.today())
         return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-    async def get_report_last_week(self) -> BytesIO:
+    async def get_report_last_week(self) -> BinaryIO:
         """
         Asynchronously gets the report for the last week.
-        Returns a BytesIO object.
+        Returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
-        year = datetime.now().year
-        week_number = get_week_number() - 1
-        start, end = get_start_end_of_week(year, week_number)
-
+        start, end = get_week(self.today(), weeks_ago=1)
         return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-    async def get_report_last_month(self) -> BytesIO:
+    async def get_report_last_month(self) -> BinaryIO:
         """
         Asynchronously gets the report for the last month.
-        Returns a BytesIO object.
+        Returns a file object.
 
         Returns:
-            BytesIO: A BytesIO object containing the report.
+            BinaryIO: A file object containing the report.
         """
+        start, end = get_last_month(self.today())
+        return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
 
-        first_day = get_first_day_of_month()
-        end = (datetime.fromisoformat(first_day) - timedelta(days=1)).isoformat()[:10]
-        start = get_first_day_of_month(end)
+    @staticmethod
+    def today() -> str:
+        """
+        Returns the current date in the format '%Y-%m-%d'.
+        """
+        return datetime.now().strftime("%Y-%m-%d")
 
-        return await self.get_report(start, end, f"report_from {start}_to_{end}.xlsx")
+    def get_standard_periods(self) -> list[tuple[str, str]]:
+        """
+        Returns the periods of the reports available by the bot commands.
+
+        Returns:
+            list[tuple[str, str]]: The start and end dates of the periods.
+        """
+        today = self.today()
+        return [
+            (today, today),
+            get_last_days(7, today),
+            get_last_days(30, today),
+            get_week(today),
+            get_week(today, weeks_ago=1),
+            get_first_and_last_day_of_month(today),
+            get_last_month(today),
+        ]
+
+    async def refresh(self):
+        """
+        Asynchronously fetches the reports for the standard periods into the cache one after another,
+        so the bot commands are answered without waiting for the analysis service.
+        The reports are kept until the next refresh.
+        """
+        ttl = self.cache_settings.report_refresh_interval * 2
+        for start, end in self.get_standard_periods():
+            try:
+                file = await self.get_report_by_date(start, end, refresh=True, ttl=ttl)
+                file.close()
+            except Exception as error:
+                self.logger.warning(f"Failed to refresh the report from {start} to {end}: {error}")
+
+    async def __refresh_loop(self):
+        while True:
+            started_at = time.monotonic()
+            await self.refresh()
+            self.logger.debug(f"Reports refreshed in {time.monotonic() - started_at:.2f} s")
+            try:
+                await asyncio.wait_for(self._refresh_event.wait(), self.cache_settings.report_refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                await self.__wait_quiet()
+            self._refresh_event.clear()
+
+    async def __wait_quiet(self):
+        """Waits until there are no invalidations for `report_refresh_delay` seconds,
+        but no longer than `report_refresh_interval`, so a burst of uploads causes one refresh."""
+        deadline = time.monotonic() + self.cache_settings.report_refresh_interval
+        while (timeout := min(self.cache_settings.report_refresh_delay, deadline - time.monotonic())) > 0:
+            self._refresh_event.clear()
+            try:
+                await asyncio.wait_for(self._refresh_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
 
     def create_report_commands(self) -> list[tuple[str, str, Callable[[], Coroutine]]]:
         return [
             ("report_week", "Отчет за неделю", self.get_report_week),
             ("report_month", "Отчет за месяц", self.get_report_month),
-            ("report_current_day", "Отчет за текущий день", self.get_report_week),
+            ("report_current_day", "Отчет за текущий день", self.get_report_current_day),
             ("report_current_week", "Отчет за текущею неделю", self.get_report_current_week),
             ("report_current_month", "Отчет за текущий месяц", self.get_report_current_month),
             ("report_last_week", "Отчет за предыдущею неделю", self.get_report_last_week),
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Awaitable, BinaryIO, Callable, Hashable, Optional
+
+
+class ReportFile(tempfile.SpooledTemporaryFile):
+    """Spooled temporary file of the report.
+
+    The report is kept in memory until it grows beyond `max_size`, then it is moved to disk.
+    Unlike the parent class, the file name can be set, it becomes the name of the document in Telegram.
+    """
+
+    name = None
+
+
+class ReportCache:
+    """Asynchronous cache of the reports.
+
+    Reports are kept for `ttl` seconds, and the least recently used reports are evicted
+    when there are more than `max_size` of them. Reports not larger than `memory_limit`
+    are kept in memory, larger reports are kept only on disk. If `cache_dir` is set,
+    all the reports are also stored there and survive the eviction from memory and restarts,
+    the expiration time of a report on disk is kept as the modification time of its file.
+    Concurrent requests of the same report are collapsed into one upstream request,
+    which runs in its own task, so it is not cancelled with the request that started it.
+
+    Args:
+        ttl (float): How long the report is kept, in seconds.
+        max_size (int): Maximum number of reports kept.
+        memory_limit (int): Maximum size of the report kept in memory, in bytes.
+        cache_dir (str, optional): The directory of the disk tier. Defaults to None,
+            a temporary directory is used for the large reports.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int,
+        memory_limit: int,
+        cache_dir: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.memory_limit = memory_limit
+        self.persistent = bool(cache_dir)
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix="reports_")
+        self._entries: OrderedDict[Hashable, tuple[float, Optional[bytes]]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._generation = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[BinaryIO]],
+        refresh: bool = False,
+        ttl: Optional[float] = None,
+    ) -> BinaryIO:
+        """Returns the cached report, or fetches it if it is not cached.
+
+        Args:
+            key (Hashable): The key of the report.
+            fetch (Callable[[], Awaitable[BinaryIO]]): The function that fetches the report.
+            refresh (bool, optional): Whether to fetch the report even if it is cached. Defaults to False.
+            ttl (float, optional): How long the fetched report is kept. Defaults to the TTL of the cache.
+
+        Returns:
+            BinaryIO: A new file object of the report, the caller closes it.
+        """
+        if not refresh and (file := await self.get(key)) is not None:
+            return file
+        if task := self._inflight.get(key):
+            await asyncio.shield(task)
+            return await self.get_or_fetch(key, fetch, ttl=ttl)
+        task = asyncio.create_task(self.__fetch(key, fetch, ttl))
+        self._inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            task.add_done_callback(self.__close_result)
+            raise
+
+    async def get(self, key: Hashable) -> Optional[BinaryIO]:
+        """Returns the cached report.
+
+        Args:
+            key (Hashable): The key of the report.
+
+        Returns:
+            Optional[BinaryIO]: A new file object of the report, or None if it is not cached or expired.
+        """
+        if entry := self._entries.get(key):
+            expires_at, data = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                if data is not None:
+                    return BytesIO(data)
+                if opened := await asyncio.to_thread(self._open, key):
+                    return opened[1]
+            # The entry may have been replaced or removed while the file was being opened.
+            if self._entries.get(key) is entry:
+                self.__pop(key)
+        if self.persistent and (opened := await asyncio.to_thread(self._open, key)):
+            expires_at, file = opened
+            size = os.fstat(file.fileno()).st_size
+            data = await asyncio.to_thread(file.read) if size <= self.memory_limit else None
+            self.__set_entry(key, expires_at, data)
+            if data is None:
+                return file
+            file.close()
+            return BytesIO(data)
+        return None
+
+    async def set(self, key: Hashable, file: BinaryIO, ttl: Optional[float] = None):
+        """Puts the report into the cache.
+
+        Args:
+            key (Hashable): The key of the report.
+            file (BinaryIO): The file of the report, it is read from the beginning.
+            ttl (float, optional): How long the report is kept. Defaults to the TTL of the cache.
+        """
+        expires_at = time.time() + (ttl or self.ttl)
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        data = await asyncio.to_thread(file.read) if size <= self.memory_limit else None
+        if data is None or self.persistent:
+            await asyncio.to_thread(self._write, key, file, expires_at)
+        self.__set_entry(key, expires_at, data)
+
+    async def clear(self):
+        """Removes all the reports from the cache.
+
+        The reports that are being fetched at the moment are not cached either.
+        """
+        self._generation += 1
+        self._inflight.clear()
+        self._entries.clear()
+        await asyncio.to_thread(self._clear_dir)
+
+    async def __fetch(
+        self, key: Hashable, fetch: Callable[[], Awaitable[BinaryIO]], ttl: Optional[float]
+    ) -> BinaryIO:
+        generation = self._generation
+        try:
+            file = await fetch()
+            if generation == self._generation:
+                try:
+                    await self.set(key, file, ttl)
+                except BaseException:
+                    file.close()
+                    raise
+                file.seek(0)
+            return file
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    @staticmethod
+    def __close_result(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            task.result().close()
+
+    def __set_entry(self, key: Hashable, expires_at: float, data: Optional[bytes]):
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self.__pop(next(iter(self._entries)))
+
+    def __pop(self, key: Hashable):
+        if (entry := self._entries.pop(key, None)) is None:
+            return
+        if entry[1] is None and not self.persistent:
+            self._remove(key)
+
+    def _path(self, key: Hashable) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.xlsx")
+
+    def _open(self, key: Hashable) -> Optional[tuple[float, BinaryIO]]:
+        path = self._path(key)
+        try:
+            expires_at = os.path.getmtime(path)
+            if expires_at <= time.time():
+                os.remove(path)
+                return None
+            return expires_at, open(path, "rb", buffering=0)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: Hashable, file: BinaryIO, expires_at: float):
+        path = self._path(key)
+        file.seek(0)
+        with open(f"{path}.tmp", "wb") as cache_file:
+            shutil.copyfileobj(file, cache_file)
+        os.utime(f"{path}.tmp", (expires_at, expires_at))
+        os.replace(f"{path}.tmp", path)
+
+    def _remove(self, key: Hashable):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _clear_dir(self):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path):
+                os.remove(path)
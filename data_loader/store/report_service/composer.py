@@ -0,0 +1,41 @@
+from typing import BinaryIO
+
+from openpyxl import Workbook, load_workbook
+
+from store.report_service.cache import ReportFile
+
+
+def merge_reports(reports: list[BinaryIO], spool_size: int) -> ReportFile:
+    """
+    Merge the reports for consecutive periods into one report.
+
+    The first sheet of each report is expected to have a header row followed by data rows.
+    The header is taken from the first report, and the data rows of all reports are
+    appended one after another.
+
+    Args:
+        reports (list[BinaryIO]): The xlsx reports in chronological order.
+        spool_size (int): The size above which the merged report is moved to disk.
+
+    Returns:
+        ReportFile: The merged xlsx report.
+    """
+    merged = Workbook(write_only=True)
+    sheet = None
+    for report in reports:
+        workbook = load_workbook(report, read_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if sheet is None:
+            sheet = merged.create_sheet(workbook.worksheets[0].title)
+            if header is not None:
+                sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+        workbook.close()
+    if sheet is None:
+        merged.create_sheet()
+    file = ReportFile(max_size=spool_size)
+    merged.save(file)
+    file.seek(0)
+    return file
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Tuple
+from typing import List, Tuple
 
 
 def get_week_number(date_string: str = datetime.now().strftime("%Y-%m-%d")) -> int:
@@ -82,3 +82,64 @@ def get_first_and_last_day_of_month(
     first_day = get_first_day_of_month(date_string)
     last_day = get_last_day_of_month(date_string)
     return first_day, last_day
+
+
+def get_days(start_date: str, end_date: str) -> List[str]:
+    """
+    Get all the days from the start date to the end date inclusive.
+
+    Args:
+        start_date (str): The start date in the format '%Y-%m-%d'.
+        end_date (str): The end date in the format '%Y-%m-%d'.
+
+    Returns:
+        List[str]: The days in the format '%Y-%m-%d'.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    return [(start + timedelta(days)).isoformat()[:10] for days in range((end - start).days + 1)]
+
+
+def get_last_days(days: int, date_string: str) -> Tuple[str, str]:
+    """
+    Get the period of the given number of days ending with the given date.
+
+    Args:
+        days (int): The number of days in the period.
+        date_string (str): The last day of the period in the format '%Y-%m-%d'.
+
+    Returns:
+        Tuple[str, str]: A tuple containing the first and last day of the period in the format '%Y-%m-%d'.
+    """
+    date = datetime.strptime(date_string, "%Y-%m-%d")
+    return (date - timedelta(days - 1)).isoformat()[:10], date_string
+
+
+def get_week(date_string: str, weeks_ago: int = 0) -> Tuple[str, str]:
+    """
+    Get the start and end dates of the week of the given date, or of an earlier week.
+
+    Args:
+        date_string (str): The date string in the format '%Y-%m-%d'.
+        weeks_ago (int, optional): How many weeks before the week of the date. Defaults to 0.
+
+    Returns:
+        Tuple[str, str]: A tuple containing the start date and end date of the week in the format '%Y-%m-%d'.
+    """
+    date = datetime.strptime(date_string, "%Y-%m-%d")
+    return get_start_end_of_week(date.isocalendar()[0], get_week_number(date_string) - weeks_ago)
+
+
+def get_last_month(date_string: str) -> Tuple[str, str]:
+    """
+    Get the first and last day of the month preceding the month of the given date.
+
+    Args:
+        date_string (str): The date string in the format '%Y-%m-%d'.
+
+    Returns:
+        Tuple[str, str]: A tuple containing the first and last day of the month in the format '%Y-%m-%d'.
+    """
+    first_day = get_first_day_of_month(date_string)
+    end = (datetime.fromisoformat(first_day) - timedelta(days=1)).isoformat()[:10]
+    return get_first_day_of_month(end), end
@@ -1,6 +1,8 @@
 """A module describing services for working with data."""
 
 from store.bot.accessor import TgBotAccessor
+from store.http_client.accessor import HttpClientAccessor
+from store.job_queue.accessor import JobQueueAccessor
 from store.report_service.accessor import TGReportService
 from store.ya_disk.accessor import YaDiskAccessor
 
@@ -8,18 +10,22 @@ from store.ya_disk.accessor import YaDiskAccessor
 class Store:
     """Store, data service and working with it."""
 
-    def __init__(self, app):
+    def __init__(self, app, bot: bool = True):
         """Initializing data sources.
 
         Args:
             app: The application
+            bot (bool, optional): Whether the Telegram bot runs in this process,
+                then the reports are served and the files are uploaded here. Defaults to True.
         """
-        self.ya_disk = YaDiskAccessor(app)
-        self.tg_report = TGReportService(app)
+        if bot:
+            self.ya_disk = YaDiskAccessor(app)
+            self.tg_report = TGReportService(app)
+        self.job_queue = JobQueueAccessor(app, consumer=bot)
         # self.bot = TgBotAccessor(app)
 
 
-def setup_store(app):
+def setup_store(app, bot: bool = True):
     """Configuring the connection and disconnection of storage.
 
     Here we inform the application about the databases of the database and other
@@ -28,6 +34,9 @@ def setup_store(app):
 
     Args:
         app: The application
+        bot (bool, optional): Whether the Telegram bot runs in this process. Defaults to True.
     """
-    app.bot = TgBotAccessor(app)
-    app.store = Store(app)
+    app.http = HttpClientAccessor(app)
+    if bot:
+        app.bot = TgBotAccessor(app)
+    app.store = Store(app, bot)
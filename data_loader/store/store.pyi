@@ -1,17 +1,27 @@
 from core.components import Application
+from store.bot.accessor import TgBotAccessor
+from store.http_client.accessor import HttpClientAccessor
+from store.job_queue.accessor import JobQueueAccessor
+from store.report_service.accessor import TGReportService
 from store.ya_disk.accessor import YaDiskAccessor
 
 class Store:
     """Store, data service and working with it."""
 
     ya_disk: YaDiskAccessor
-    def __init__(self, app: Application):
+    tg_report: TGReportService
+    job_queue: JobQueueAccessor
+    def __init__(self, app: Application, bot: bool = True):
         """
         Initialize the store.
 
         Args:
             app (Application): The main application component.
+            bot (bool, optional): Whether the Telegram bot runs in this process. Defaults to True.
         """
 
-def setup_store(app: Application):
-    app.store = Store(app)
+def setup_store(app: Application, bot: bool = True):
+    app.http = HttpClientAccessor(app)
+    if bot:
+        app.bot = TgBotAccessor(app)
+    app.store = Store(app, bot)
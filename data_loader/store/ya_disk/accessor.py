@@ -1,20 +1,36 @@
+import asyncio
+import time
 from io import BytesIO
-from typing import AsyncIterator, Callable, Optional
+from typing import AsyncIterator, Callable
 
 from base.base_accessor import BaseAccessor
-from core.settings import YaDiskSettings
+from core.settings import YaDiskSettings, get_settings
 from store.ya_disk.exception import YaTokenNotValidException
 from yadisk import AsyncClient
-from yadisk.exceptions import PathExistsError, ResourceIsLockedError
+from yadisk.sessions.aiohttp_session import AIOHTTPSession
+from yadisk.exceptions import (
+    PathExistsError,
+    ResourceIsLockedError,
+    UnauthorizedError,
+)
 
 
 class YaDiskAccessor(BaseAccessor):
+    dependencies = ("HttpClientAccessor",)
     settings: YaDiskSettings
-    client: AsyncClient
+    client: AsyncClient = None
+    _remote_paths: set[str]
+    _next_numbers: dict[str, int]
+    _reserved: dict[str, int]
+    _token_lock: asyncio.Lock
+    _token_valid_until: float = 0
 
     def _check_token(func):  # noqa:
         """A decorator that verifies the Yandex disk token before executing the decorated function.
 
+        The result of the verification is cached for `ya_token_ttl` seconds,
+        and the cache is reset as soon as Yandex Disk rejects the token.
+
         Args:
             func (function): The function to be decorated.
 
@@ -34,24 +50,53 @@ class YaDiskAccessor(BaseAccessor):
             Returns:
                 object: The return value of the decorated function.
             """
-            if await self.client.check_token(self.settings.ya_token):
+            if not await self.is_token_valid():
+                raise YaTokenNotValidException()
+            try:
                 return await func(self, *args, **kwargs)
-            raise YaTokenNotValidException()
+            except UnauthorizedError as error:
+                self._token_valid_until = 0
+                raise YaTokenNotValidException(exception=error)
 
         return inner
 
+    async def is_token_valid(self) -> bool:
+        """Checks the Yandex disk token, using the cached result if it has not expired.
+
+        Concurrent callers wait for a single verification request.
+
+        Returns:
+            bool: True if the token is valid.
+        """
+        if self._token_valid_until > time.monotonic():
+            return True
+        async with self._token_lock:
+            if self._token_valid_until > time.monotonic():
+                return True
+            if not await self.client.check_token(self.settings.ya_token):
+                return False
+            self._token_valid_until = time.monotonic() + self.settings.ya_token_ttl
+            return True
+
     async def connect(self):
         """Connects to the Yandex Disk API using the provided client ID and access token.
 
+        The client uses the connection pool of the shared HTTP client of the application.
+
         Args:
             self (YandexDisk): The YandexDisk instance.
 
         Returns:
             None: Returns nothing.
         """
-        self.settings = YaDiskSettings()
+        self.settings = get_settings(YaDiskSettings)
+        self._token_lock = asyncio.Lock()
         self.client = AsyncClient(
-            self.settings.ya_client_id, token=self.settings.ya_token, session="aiohttp"
+            self.settings.ya_client_id,
+            token=self.settings.ya_token,
+            session_factory=lambda: AIOHTTPSession(
+                connector=self.app.http.connector, connector_owner=False
+            ),
         )
         await self.__setup()
         self.logger.info("Yandex disk client connected")
@@ -65,7 +110,8 @@ class YaDiskAccessor(BaseAccessor):
         Returns:
             None: Returns nothing.
         """
-        await self.client.close()
+        if self.client is not None:
+            await self.client.close()
         self.logger.info("Yandex disk client disconnected")
 
     @_check_token  # noqa:
@@ -78,41 +124,68 @@ class YaDiskAccessor(BaseAccessor):
         Returns:
             None: Returns nothing.
         """
+        self._remote_paths = set()
+        self._next_numbers = {}
+        self._reserved = {}
         if not await self.client.is_dir(self.settings.ya_dir):
             await self.client.mkdir(self.settings.ya_dir)
+            return
+        items = await self.client.listdir(self.settings.ya_dir, fields=["name"])
+        async for item in items:
+            self._remote_paths.add(self.make_file_path(item.name))
+        self.logger.info(f"Yandex disk: {len(self._remote_paths)} files in {self.settings.ya_dir}")
 
     @_check_token  # noqa:
     async def upload_file(
-        self, file: BytesIO | bytes, file_name: str
-    ) -> Optional[bool]:
+        self,
+        file: BytesIO | bytes | Callable[[], AsyncIterator[bytes]],
+        file_name: str,
+    ) -> str:
         """Uploads a file to Yandex Disk.
 
+        The file can be passed as a function that returns an asynchronous iterator of bytes,
+        in this case the file is streamed to the cloud chunk by chunk.
+
         Args:
-            file (BytesIO | bytes): The file to be uploaded.
+            file (BytesIO | bytes | Callable[[], AsyncIterator[bytes]]): The file to be uploaded.
             file_name (str): The name of the file.
 
         Returns:
-            Optional[bool]: Returns True if the file was uploaded successfully, raises an exception otherwise.
+            str: The path of the uploaded file on Yandex Disk.
 
         Raises:
             ValueError: If the file could not be uploaded after a certain number of attempts.
         """
-        number = 0
-        while number < self.settings.ya_attempt_count:
-            upload_file = self.make_file_path(
-                f"{file_name}", str(number) if number else ""
-            )
+        for _ in range(self.settings.ya_attempt_count):
+            upload_file = self.reserve_file_path(file_name)
             try:
-                await self.client.upload(file, upload_file)
-                return True
+                url = await self.client.get_upload_link(upload_file)
+                await self.client.upload_by_link(file, url)
+                self._reserved.pop(upload_file, None)
+                return upload_file
             except PathExistsError:
+                self._reserved.pop(upload_file, None)
                 self.logger.warning(f"File {upload_file} already exists")
             except ResourceIsLockedError:
+                self._reserved.pop(upload_file, None)
                 self.logger.warning(f"File {upload_file} is locked")
-            number += 1
+            except BaseException:
+                self.release_file_path(file_name, upload_file)
+                raise
 
         raise ValueError(f"Please rename upload file")
 
+    async def exists(self, path: str) -> bool:
+        """Checks whether the file exists on Yandex Disk.
+
+        Args:
+            path (str): The path of the file on Yandex Disk.
+
+        Returns:
+            bool: True if the file exists.
+        """
+        return await self.client.exists(path)
+
     def make_file_path(self, upload_file_name: str, number: str = "") -> str:
         """Creates a unique path for the uploaded file on Yandex Disk.
 
@@ -128,9 +201,46 @@ class YaDiskAccessor(BaseAccessor):
         name += f".{'.'.join(suf)}" if suf else ""
         return "/".join([self.settings.ya_dir, name])
 
+    def reserve_file_path(self, upload_file_name: str) -> str:
+        """Picks a free path for the uploaded file using the index of the remote directory.
+
+        The path is marked as taken at once, so concurrent uploads of files with
+        the same name get different paths. If the index is out of date, the upload
+        gets `PathExistsError` and asks for the next path.
+
+        Args:
+            upload_file_name (str): The name of the file to be uploaded.
+
+        Returns:
+            str: The free path for the uploaded file on Yandex Disk.
+        """
+        number = self._next_numbers.get(upload_file_name, 0)
+        while (
+            path := self.make_file_path(upload_file_name, str(number) if number else "")
+        ) in self._remote_paths:
+            number += 1
+        self._next_numbers[upload_file_name] = number + 1
+        self._remote_paths.add(path)
+        self._reserved[path] = number
+        return path
+
+    def release_file_path(self, upload_file_name: str, path: str):
+        """Frees the path reserved for an upload that failed, so the next upload of the file gets it again.
+
+        Args:
+            upload_file_name (str): The name of the file that was being uploaded.
+            path (str): The path returned by `reserve_file_path`.
+        """
+        if (number := self._reserved.pop(path, None)) is None:
+            return
+        self._remote_paths.discard(path)
+        self._next_numbers[upload_file_name] = min(
+            self._next_numbers.get(upload_file_name, number), number
+        )
+
     async def download_to_cloud(
         self, file_name: str, iter_download: Callable[[], AsyncIterator[bytes]]
-    ):
+    ) -> str:
         """Downloads a file to Yandex Disk.
 
         Parameters:
@@ -139,14 +249,6 @@ class YaDiskAccessor(BaseAccessor):
             of bytes that represents the contents of the file to download.
 
         Returns:
-            Any: The result of the Yandex Disk upload operation.
+            str: The path of the uploaded file on Yandex Disk.
         """
-        number = 0
-        while True:
-            path = self.make_file_path(file_name, str(number) if number else None)
-            try:
-                url = await self.client.get_upload_link(path)
-                return await self.client.upload_by_link(iter_download, url)
-            except PathExistsError:
-                pass
-            number += 1
+        return await self.upload_file(iter_download, file_name)